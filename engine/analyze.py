@@ -0,0 +1,144 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from engine.bitboard import new_board
+from engine.rules import Rules
+from engine.eval import Evaluator
+from engine.search import Search, MATE_SCORE
+
+#Positions queued per worker process, bounds memory for huge inputs
+TASKS_PER_PROCESS = 4
+
+#Splits an EPD or FEN line into (fen, id). EPD lines have only the first
+#four FEN fields followed by opcodes such as bm e4; id "name";
+def parse_position(line) -> tuple:
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6]), None
+    fen = " ".join(fields[:4]) + " 0 1"
+    position_id = None
+    for opcode in " ".join(fields[4:]).split(";"):
+        opcode = opcode.strip()
+        if opcode.startswith("id "):
+            position_id = opcode[3:].strip().strip('"')
+    return fen, position_id
+
+#Lazily yields (index, fen, id), skipping blank lines and # comments
+def read_positions(stream, skip=0):
+    index = 0
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if index >= skip:
+            fen, position_id = parse_position(line)
+            yield index, fen, position_id
+        index += 1
+
+#Runs in a worker process, one fresh Search per position so results do
+#not depend on which positions a worker saw before
+def analyze_position(task) -> dict:
+    index, fen, position_id, depth, movetime, nodes, backend = task
+    result = {"index": index, "fen": fen}
+    if position_id is not None:
+        result["id"] = position_id
+    try:
+        board = new_board(fen, backend)
+    except (ValueError, IndexError, KeyError) as e:
+        result["error"] = f"bad position: {e}"
+        return result
+    rules = Rules(board)
+    search = Search(board, rules, Evaluator())
+    search.verbose = False
+    start = time.perf_counter()
+    best_move = search.find_best_move(depth, movetime=movetime, nodes=nodes)
+    elapsed = time.perf_counter() - start
+    if best_move is None:
+        #Nothing to play: scored as mate or stalemate for the side to move
+        color = "w" if board.white_to_move else "b"
+        score = -MATE_SCORE if rules.in_check(color) else 0
+    else:
+        score = search.best_score
+    result["best_move"] = best_move.to_uci() if best_move else None
+    result["score"] = score
+    result["depth"] = search.completed_depth
+    result["nodes"] = search.nodes_searched + search.qnodes
+    result["time"] = round(elapsed, 4)
+    return result
+
+#Number of complete result lines in a partly written output. A torn last
+#line (the run was killed mid-write) is cut off so appending stays valid
+def count_finished(path) -> int:
+    if not os.path.exists(path):
+        return 0
+    finished = 0
+    good_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            finished += 1
+            good_size += len(line)
+    if good_size != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_size)
+    return finished
+
+#Results come back in input order. At most processes * TASKS_PER_PROCESS
+#positions are in flight, the input is never read further ahead than that
+def analyze(positions, depth=None, movetime=None, nodes=None, processes=None, backend="grid"):
+    processes = processes or os.cpu_count() or 1
+    window = processes * TASKS_PER_PROCESS
+    if depth is None and movetime is None and nodes is None:
+        depth = 4
+    pending = collections.deque()
+    with multiprocessing.Pool(processes) as pool:
+        for index, fen, position_id in positions:
+            task = (index, fen, position_id, depth, movetime, nodes, backend)
+            pending.append(pool.apply_async(analyze_position, (task,)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search every position of an EPD/FEN file, writes JSONL in input order.")
+    parser.add_argument("input", nargs="?", default="-", help="EPD/FEN file, - for stdin")
+    parser.add_argument("--output", help="JSONL file to write, stdout if not given")
+    parser.add_argument("--resume", action="store_true", help="skip positions already in --output and append")
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--movetime", type=int, help="milliseconds per position")
+    parser.add_argument("--nodes", type=int)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--backend", choices=["grid", "bitboard"], default="grid")
+    args = parser.parse_args(argv)
+
+    skip = 0
+    if args.resume and args.output:
+        skip = count_finished(args.output)
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout
+    if args.output:
+        out = open(args.output, "a" if args.resume else "w")
+    try:
+        positions = read_positions(source, skip)
+        for result in analyze(positions, args.depth, args.movetime, args.nodes, args.processes, args.backend):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,585 @@
+from engine.board import Board
+from engine.move import Move
+from engine.eval import SQUARE_SCORES_MG, SQUARE_SCORES_EG
+from engine.zobrist import PIECES, PIECE_KEYS, SIDE_KEY, EN_PASSANT_KEYS
+
+#Square index is row * 8 + col, so bit 0 is a8 and bit 63 is h1
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+#Rows pawns land on after a single push that may be pushed again
+WHITE_DOUBLE_ROW = 0xFF << 40
+BLACK_DOUBLE_ROW = 0xFF << 16
+
+#Shared (row, col) tuples so move generation does not allocate squares
+SQUARES = [(sq >> 3, sq & 7) for sq in range(64)]
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        bb = 0
+        for dr, dc in offsets:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < 8 and 0 <= nc < 8:
+                bb |= 1 << (nr * 8 + nc)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([
+    (-2, -1), (-2, 1), (2, -1), (2, 1),
+    (-1, -2), (-1, 2), (1, -2), (1, 2)
+])
+KING_ATTACKS = _leaper_table([
+    (-1, -1), (-1, 0), (-1, 1),
+    (0, -1), (0, 1), (1, -1),
+    (1, 0), (1, 1)
+])
+#Squares a pawn of that color on sq attacks
+PAWN_ATTACKS = {
+    "w": _leaper_table([(-1, -1), (-1, 1)]),
+    "b": _leaper_table([(1, -1), (1, 1)])
+}
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        bb = 0
+        nr, nc = r + dr, c + dc
+        while 0 <= nr < 8 and 0 <= nc < 8:
+            bb |= 1 << (nr * 8 + nc)
+            nr += dr
+            nc += dc
+        table.append(bb)
+    return table
+
+#Rays going towards higher square indexes find their first blocker with the
+#lowest set bit, rays going towards lower indexes with the highest.
+#(direction, table, positive, diagonal)
+RAYS = [
+    ((dr, dc), _ray_table(dr, dc), dr * 8 + dc > 0, dr != 0 and dc != 0)
+    for dr, dc in [(1, -1), (1, 1), (-1, -1), (-1, 1), (0, 1), (1, 0), (0, -1), (-1, 0)]
+]
+BISHOP_RAYS = [(table, positive) for _, table, positive, diagonal in RAYS if diagonal]
+ROOK_RAYS = [(table, positive) for _, table, positive, diagonal in RAYS if not diagonal]
+
+def sliding_attacks(sq, occupied, rays) -> int:
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+#Attacks for every arrangement of blockers, looked up by occupied & mask,
+#a dict stand-in for magic bitboards (about 100k entries, built at import).
+#The mask leaves out the last square of each ray, nothing lies behind it
+def _attack_table(rays) -> tuple:
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = 0
+        for table, positive in rays:
+            ray = table[sq]
+            if ray:
+                ray ^= (1 << (ray.bit_length() - 1)) if positive else (ray & -ray)
+            mask |= ray
+        attacks = {}
+        #Every subset of mask, the carry-rippler way
+        subset = 0
+        while True:
+            attacks[subset] = sliding_attacks(sq, subset, rays)
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        masks.append(mask)
+        tables.append(attacks)
+    return masks, tables
+
+BISHOP_MASKS, BISHOP_TABLES = _attack_table(BISHOP_RAYS)
+ROOK_MASKS, ROOK_TABLES = _attack_table(ROOK_RAYS)
+
+def bishop_attacks(sq, occupied) -> int:
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+def rook_attacks(sq, occupied) -> int:
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+def iter_squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+class BitBoard(Board):
+    #Same public API as Board, but the position is kept as a 64-bit int per
+    #piece/color plus a flat 64-square mailbox. board, piece_squares and
+    #king_squares are built from those on demand, make_move/undo_move and
+    #move generation never touch a grid
+    backend = "bitboard"
+
+    @property
+    def board(self):
+        mailbox = self.mailbox
+        return [mailbox[r * 8:r * 8 + 8] for r in range(8)]
+    @board.setter
+    def board(self, rows):
+        #Board's setup code assigns a whole grid, _init_piece_lists follows
+        self.mailbox = [piece for row in rows for piece in row]
+    @property
+    def piece_squares(self):
+        return {piece: {SQUARES[sq] for sq in iter_squares(bb)} for piece, bb in self.bitboards.items()}
+    @property
+    def king_squares(self):
+        return {"w": self.find_king("w"), "b": self.find_king("b")}
+    def _init_piece_lists(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        for sq, piece in enumerate(self.mailbox):
+            if piece != "--":
+                self.bitboards[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+    def _copy_pieces(self, new_board):
+        new_board.mailbox = self.mailbox[:]
+        new_board.bitboards = self.bitboards.copy()
+        new_board.occupancy = self.occupancy.copy()
+    def get_piece(self, row, col) -> str:
+        if 0 <= row < 8 and 0 <= col < 8:
+            return self.mailbox[row * 8 + col]
+        else:
+            return ValueError("Row and Column must be between 0 and 7 inclusive.")
+    def find_king(self, color: str) -> tuple:
+        king = self.bitboards[color + "K"]
+        return SQUARES[king.bit_length() - 1] if king else None
+    def set_piece(self, row, col, piece: str):
+        if not (0 <= row < 8 and 0 <= col < 8):
+            return ValueError("Row and Column must be between 0 and 7 inclusive.")
+        sq = row * 8 + col
+        bit = 1 << sq
+        old = self.mailbox[sq]
+        if old != "--":
+            self.bitboards[old] ^= bit
+            self.occupancy[old[0]] ^= bit
+            self.eval_mg -= SQUARE_SCORES_MG[old][sq]
+            self.eval_eg -= SQUARE_SCORES_EG[old][sq]
+            self.piece_count -= 1
+        if piece != "--":
+            self.bitboards[piece] |= bit
+            self.occupancy[piece[0]] |= bit
+            self.eval_mg += SQUARE_SCORES_MG[piece][sq]
+            self.eval_eg += SQUARE_SCORES_EG[piece][sq]
+            self.piece_count += 1
+        self.mailbox[sq] = piece
+    #Same bookkeeping as Board.make_move (key, scores, rights, clocks) with
+    #the pieces moved in the bitboards and mailbox
+    def make_move(self, move: Move):
+        if type(move) is int:
+            move = Move.decode(move, self)
+        key = self.zobrist_key
+        self.move_stack.append((
+            move,
+            move.moved_piece,
+            move.piece_captured,
+            self.castle_rights.copy(),
+            self.en_passant_square,
+            self.halfmoves,
+            self.fullmoves,
+            key,
+            self.eval_mg,
+            self.eval_eg,
+            self.piece_count
+        ))
+        self.hash_history.append(key)
+
+        mailbox = self.mailbox
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        piece = move.moved_piece
+        color = piece[0]
+        enemy = "b" if color == "w" else "w"
+        start_r, start_c = move.start
+        end_r, end_c = move.end
+        start_sq = start_r * 8 + start_c
+        end_sq = end_r * 8 + end_c
+        start_bit = 1 << start_sq
+        end_bit = 1 << end_sq
+        mg = self.eval_mg
+        eg = self.eval_eg
+
+        target = mailbox[end_sq]
+        if target != "--":
+            bitboards[target] ^= end_bit
+            occupancy[enemy] ^= end_bit
+            key ^= PIECE_KEYS[target][end_sq]
+            mg -= SQUARE_SCORES_MG[target][end_sq]
+            eg -= SQUARE_SCORES_EG[target][end_sq]
+            self.piece_count -= 1
+        elif piece[1] == "P" and move.end == self.en_passant_square:
+            captured_sq = start_r * 8 + end_c
+            captured_bit = 1 << captured_sq
+            captured_pawn = enemy + "P"
+            mailbox[captured_sq] = "--"
+            bitboards[captured_pawn] ^= captured_bit
+            occupancy[enemy] ^= captured_bit
+            key ^= PIECE_KEYS[captured_pawn][captured_sq]
+            mg -= SQUARE_SCORES_MG[captured_pawn][captured_sq]
+            eg -= SQUARE_SCORES_EG[captured_pawn][captured_sq]
+            self.piece_count -= 1
+        elif piece[1] == "K" and abs(end_c - start_c) == 2:
+            rook = color + "R"
+            if end_c == 6:
+                rook_from, rook_to = start_sq + 3, start_sq + 1
+            else:
+                rook_from, rook_to = start_sq - 4, start_sq - 1
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            mailbox[rook_from] = "--"
+            mailbox[rook_to] = rook
+            bitboards[rook] ^= rook_bits
+            occupancy[color] ^= rook_bits
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+            mg += SQUARE_SCORES_MG[rook][rook_to] - SQUARE_SCORES_MG[rook][rook_from]
+            eg += SQUARE_SCORES_EG[rook][rook_to] - SQUARE_SCORES_EG[rook][rook_from]
+
+        placed = color + move.promotion if move.promotion else piece
+        mailbox[start_sq] = "--"
+        mailbox[end_sq] = placed
+        bitboards[piece] ^= start_bit
+        bitboards[placed] ^= end_bit
+        occupancy[color] ^= start_bit | end_bit
+        key ^= PIECE_KEYS[piece][start_sq] ^ PIECE_KEYS[placed][end_sq]
+        mg += SQUARE_SCORES_MG[placed][end_sq] - SQUARE_SCORES_MG[piece][start_sq]
+        eg += SQUARE_SCORES_EG[placed][end_sq] - SQUARE_SCORES_EG[piece][start_sq]
+
+        if self.en_passant_square is not None:
+            key ^= EN_PASSANT_KEYS[self.en_passant_square[1]]
+        if piece[1] == "P" and abs(start_r - end_r) == 2:
+            self.en_passant_square = ((start_r + end_r) // 2, start_c)
+            key ^= EN_PASSANT_KEYS[start_c]
+        else:
+            self.en_passant_square = None
+
+        key = self._update_castle_rights(move, piece, key)
+
+        if piece[1] == "P" or target != "--":
+            self.halfmoves = 0
+        else:
+            self.halfmoves += 1
+        if not self.white_to_move:
+            self.fullmoves += 1
+        self.white_to_move = not self.white_to_move
+        self.zobrist_key = key ^ SIDE_KEY
+        self.eval_mg = mg
+        self.eval_eg = eg
+    def undo_move(self):
+        if not self.move_stack:
+            return
+        (move, moved_piece, captured_piece, castling_rights, en_passant_square,
+            halfmoves, fullmoves, zobrist_key, eval_mg, eval_eg, piece_count) = self.move_stack.pop()
+        self.hash_history.pop()
+        self.en_passant_square = en_passant_square
+        self.halfmoves = halfmoves
+        self.zobrist_key = zobrist_key
+        self.white_to_move = not self.white_to_move
+        if move is None:
+            return
+        self.castle_rights = castling_rights
+        self.fullmoves = fullmoves
+        self.eval_mg = eval_mg
+        self.eval_eg = eval_eg
+        self.piece_count = piece_count
+
+        mailbox = self.mailbox
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        color = moved_piece[0]
+        enemy = "b" if color == "w" else "w"
+        start_r, start_c = move.start
+        end_r, end_c = move.end
+        start_sq = start_r * 8 + start_c
+        end_sq = end_r * 8 + end_c
+        start_bit = 1 << start_sq
+        end_bit = 1 << end_sq
+
+        #Whatever stands on the end square now is the moved or promoted piece
+        bitboards[mailbox[end_sq]] ^= end_bit
+        bitboards[moved_piece] ^= start_bit
+        occupancy[color] ^= start_bit | end_bit
+        mailbox[start_sq] = moved_piece
+        if captured_piece == "--":
+            mailbox[end_sq] = "--"
+            if moved_piece[1] == "K" and abs(end_c - start_c) == 2:
+                rook = color + "R"
+                if end_c == 6:
+                    rook_from, rook_to = start_sq + 3, start_sq + 1
+                else:
+                    rook_from, rook_to = start_sq - 4, start_sq - 1
+                rook_bits = (1 << rook_from) | (1 << rook_to)
+                mailbox[rook_to] = "--"
+                mailbox[rook_from] = rook
+                bitboards[rook] ^= rook_bits
+                occupancy[color] ^= rook_bits
+        elif moved_piece[1] == "P" and move.end == en_passant_square:
+            captured_sq = start_r * 8 + end_c
+            captured_bit = 1 << captured_sq
+            mailbox[end_sq] = "--"
+            mailbox[captured_sq] = captured_piece
+            bitboards[captured_piece] ^= captured_bit
+            occupancy[enemy] ^= captured_bit
+        else:
+            mailbox[end_sq] = captured_piece
+            bitboards[captured_piece] ^= end_bit
+            occupancy[enemy] ^= end_bit
+    #attacking_color:str, square:tuple
+    def is_square_attacked(self, square, attacking_color) -> bool:
+        return self._is_attacked(square[0] * 8 + square[1], attacking_color,
+                                 self.occupancy["w"] | self.occupancy["b"])
+    #occupied is passed in so king steps can be tested with the king lifted off
+    def _is_attacked(self, sq, attacking_color, occupied) -> bool:
+        bbs = self.bitboards
+        a = attacking_color
+        defender = "b" if a == "w" else "w"
+        #A pawn of ours on sq would attack exactly the squares their pawns attack it from
+        if PAWN_ATTACKS[defender][sq] & bbs[a + "P"]:
+            return True
+        if KNIGHT_ATTACKS[sq] & bbs[a + "N"]:
+            return True
+        if KING_ATTACKS[sq] & bbs[a + "K"]:
+            return True
+        diagonal = bbs[a + "B"] | bbs[a + "Q"]
+        if diagonal and bishop_attacks(sq, occupied) & diagonal:
+            return True
+        straight = bbs[a + "R"] | bbs[a + "Q"]
+        if straight and rook_attacks(sq, occupied) & straight:
+            return True
+        return False
+    def attackers_of(self, square, attacking_color) -> list:
+        sq = square[0] * 8 + square[1]
+        bbs = self.bitboards
+        a = attacking_color
+        defender = "b" if a == "w" else "w"
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        attackers = (
+            (PAWN_ATTACKS[defender][sq] & bbs[a + "P"]) |
+            (KNIGHT_ATTACKS[sq] & bbs[a + "N"]) |
+            (KING_ATTACKS[sq] & bbs[a + "K"]) |
+            (bishop_attacks(sq, occupied) & (bbs[a + "B"] | bbs[a + "Q"])) |
+            (rook_attacks(sq, occupied) & (bbs[a + "R"] | bbs[a + "Q"]))
+        )
+        return [SQUARES[s] for s in iter_squares(attackers)]
+    #(king square, checkers, check_mask, pins) for color's king, from attack
+    #sets: each ray out of the king is checked for a slider behind at most
+    #one of our pieces. check_mask is the squares that stop a single check
+    #(everything when not in check), pins maps a pinned piece's square to
+    #(direction, the line it may still move along)
+    def _checks_and_pins(self, color) -> tuple:
+        bbs = self.bitboards
+        king = bbs[color + "K"]
+        if not king:
+            return None, 0, FULL, {}
+        ksq = king.bit_length() - 1
+        enemy = "b" if color == "w" else "w"
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[enemy]
+        diagonal = bbs[enemy + "B"] | bbs[enemy + "Q"]
+        straight = bbs[enemy + "R"] | bbs[enemy + "Q"]
+        checkers = (KNIGHT_ATTACKS[ksq] & bbs[enemy + "N"]) | (PAWN_ATTACKS[color][ksq] & bbs[enemy + "P"])
+        check_mask = checkers
+        pins = {}
+        for direction, table, positive, is_diagonal in RAYS:
+            ray = table[ksq]
+            sliders = diagonal if is_diagonal else straight
+            if not ray & sliders:
+                continue
+            blockers = ray & occupied
+            first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            first_bit = 1 << first
+            if first_bit & sliders:
+                checkers |= first_bit
+                #The squares up to and including the checker
+                check_mask |= ray ^ table[first]
+            elif first_bit & own:
+                rest = blockers ^ first_bit
+                if rest:
+                    second = (rest & -rest).bit_length() - 1 if positive else rest.bit_length() - 1
+                    if (1 << second) & sliders:
+                        pins[first] = (direction, ray ^ table[second])
+        if not checkers:
+            check_mask = FULL
+        return ksq, checkers, check_mask, pins
+    #Same result as Rules.get_checks_and_pins
+    def get_checks_and_pins(self, color: str) -> tuple:
+        ksq, checkers, check_mask, pins = self._checks_and_pins(color)
+        if ksq is None:
+            return None, [], {}, set()
+        block_squares = set()
+        if checkers:
+            block_squares = {SQUARES[sq] for sq in iter_squares(check_mask)}
+        return (SQUARES[ksq], [SQUARES[sq] for sq in iter_squares(checkers)],
+                {SQUARES[sq]: direction for sq, (direction, line) in pins.items()}, block_squares)
+    #captures_only leaves out quiet moves, promotions are always included.
+    #quiets_only is the opposite: no captures or promotions.
+    #from_mask limits the moves to pieces on those squares
+    def generate_pseudo_legal_moves(self, color: str, captures_only=False, quiets_only=False, from_mask=FULL) -> list:
+        return self._generate_moves(color, captures_only, quiets_only, from_mask, False)
+    #Only legal moves, in the same order Rules.filter_legal_moves would leave
+    #them. Checks and pins limit the targets while generating
+    def generate_legal_moves(self, color: str, captures_only=False, quiets_only=False) -> list:
+        return self._generate_moves(color, captures_only, quiets_only, FULL, True)
+    def _generate_moves(self, color, captures_only, quiets_only, from_mask, legal) -> list:
+        moves = []
+        mailbox = self.mailbox
+        bbs = self.bitboards
+        own = self.occupancy[color]
+        enemy_color = "b" if color == "w" else "w"
+        enemy = self.occupancy[enemy_color]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        squares = SQUARES
+        #Squares pieces may move to
+        if captures_only:
+            allowed = enemy
+        elif quiets_only:
+            allowed = empty
+        else:
+            allowed = ~own
+        check_mask = FULL
+        pins = None
+        if legal:
+            ksq, checkers, check_mask, pins = self._checks_and_pins(color)
+            if checkers & (checkers - 1):
+                #Double check, only the king can move
+                check_mask = 0
+
+        if check_mask:
+            self._generate_pawn_moves(moves, color, enemy, empty, captures_only, quiets_only, from_mask, check_mask, pins)
+
+            targets_allowed = allowed & check_mask
+            for piece_type, attack_fn in (("N", None), ("B", bishop_attacks), ("R", rook_attacks), ("Q", None)):
+                piece = color + piece_type
+                for sq in iter_squares(bbs[piece] & from_mask):
+                    if piece_type == "N":
+                        targets = KNIGHT_ATTACKS[sq]
+                    elif piece_type == "Q":
+                        targets = bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+                    else:
+                        targets = attack_fn(sq, occupied)
+                    targets &= targets_allowed
+                    if pins and sq in pins:
+                        targets &= pins[sq][1]
+                    start = squares[sq]
+                    #iter_squares inlined, this is the hottest loop in move generation
+                    while targets:
+                        low = targets & -targets
+                        to = low.bit_length() - 1
+                        targets ^= low
+                        moves.append(Move(start, squares[to], piece, piece_captured=mailbox[to]))
+
+        king = color + "K"
+        for sq in iter_squares(bbs[king] & from_mask):
+            start = squares[sq]
+            #The king must not stay on a line it is checked along
+            without_king = occupied ^ (1 << sq)
+            for to in iter_squares(KING_ATTACKS[sq] & allowed):
+                if legal and self._is_attacked(to, enemy_color, without_king):
+                    continue
+                moves.append(Move(start, squares[to], king, piece_captured=mailbox[to]))
+            if not captures_only:
+                self._generate_castling(moves, color, start, occupied)
+        return moves
+    def _generate_pawn_moves(self, moves, color, enemy, empty, captures_only=False, quiets_only=False,
+                             from_mask=FULL, check_mask=FULL, pins=None):
+        mailbox = self.mailbox
+        squares = SQUARES
+        piece = color + "P"
+        pawns = self.bitboards[piece] & from_mask
+        if color == "w":
+            push = (pawns >> 8) & empty
+            double = ((push & WHITE_DOUBLE_ROW) >> 8) & empty
+            left = ((pawns & ~FILE_A) >> 9) & enemy
+            right = ((pawns & ~FILE_H) >> 7) & enemy
+            step, left_step, right_step, prom_row = -8, -9, -7, 0
+        else:
+            push = (pawns << 8) & empty
+            double = ((push & BLACK_DOUBLE_ROW) << 8) & empty
+            left = ((pawns & ~FILE_A) << 7) & enemy & FULL
+            right = ((pawns & ~FILE_H) << 9) & enemy & FULL
+            step, left_step, right_step, prom_row = 8, 7, 9, 7
+        if captures_only:
+            #Pushes only count when they promote
+            push &= 0xFF << (prom_row * 8)
+            double = 0
+        elif quiets_only:
+            push &= ~(0xFF << (prom_row * 8))
+            left = 0
+            right = 0
+
+        for targets, delta in ((push, step), (left, left_step), (right, right_step), (double, 2 * step)):
+            targets &= check_mask
+            while targets:
+                low = targets & -targets
+                to = low.bit_length() - 1
+                targets ^= low
+                if pins and to - delta in pins and not (1 << to) & pins[to - delta][1]:
+                    continue
+                start = squares[to - delta]
+                end = squares[to]
+                captured = mailbox[to]
+                if end[0] == prom_row:
+                    for prom_piece in ["Q", "R", "N", "B"]:
+                        moves.append(Move(start, end, piece, piece_captured=captured, promotion=prom_piece))
+                else:
+                    moves.append(Move(start, end, piece, piece_captured=captured))
+
+        ep = self.en_passant_square
+        if ep is not None and not quiets_only:
+            ep_sq = ep[0] * 8 + ep[1]
+            enemy_color = "b" if color == "w" else "w"
+            captured_pawn = enemy_color + "P"
+            #Our pawns that could capture onto ep are where their pawn on ep would attack
+            for sq in iter_squares(PAWN_ATTACKS[enemy_color][ep_sq] & pawns):
+                move = Move(squares[sq], ep, piece, piece_captured=captured_pawn)
+                #pins is only passed for legal moves. Two pawns leave the rank
+                #at once, which pins and check masks don't cover, so the
+                #move is tried on the board
+                if pins is not None:
+                    self.make_move(move)
+                    king_square = self.find_king(color)
+                    in_check = king_square is not None and self.is_square_attacked(king_square, enemy_color)
+                    self.undo_move()
+                    if in_check:
+                        continue
+                moves.append(move)
+    def _generate_castling(self, moves, color, start, occupied):
+        row = 7 if color == "w" else 0
+        if start != (row, 4):
+            return
+        enemy_color = "b" if color == "w" else "w"
+        rights = self.castle_rights
+        king = color + "K"
+        base = row * 8
+        if not (rights[color + "K"] or rights[color + "Q"]):
+            return
+        if self.is_square_attacked(start, enemy_color):
+            return
+        if (rights[color + "K"] and not occupied & ((1 << (base + 5)) | (1 << (base + 6))) and
+                not self.is_square_attacked((row, 5), enemy_color) and
+                not self.is_square_attacked((row, 6), enemy_color)):
+            moves.append(Move(start, (row, 6), king))
+        if (rights[color + "Q"] and
+                not occupied & ((1 << (base + 1)) | (1 << (base + 2)) | (1 << (base + 3))) and
+                not self.is_square_attacked((row, 2), enemy_color) and
+                not self.is_square_attacked((row, 3), enemy_color)):
+            moves.append(Move(start, (row, 2), king))
+
+#Board for a --backend choice: "grid" or "bitboard"
+def new_board(fen=None, backend="grid"):
+    if backend == "bitboard":
+        return BitBoard(fen)
+    return Board(fen)
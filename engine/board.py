@@ -1,11 +1,29 @@
 from engine.move import Move
 from engine.rules import Rules
+from engine.eval import SQUARE_SCORES_MG, SQUARE_SCORES_EG, compute_accumulators
+from engine.zobrist import PIECES, PIECE_KEYS, SIDE_KEY, CASTLE_KEYS, EN_PASSANT_KEYS, compute_key
+
+#Moving from or capturing on these squares removes the matching castle right
+CASTLE_ROOK_SQUARES = {
+    (7, 0): "wQ",
+    (7, 7): "wK",
+    (0, 0): "bQ",
+    (0, 7): "bK"
+}
 class Board:
+    #Rules and Evaluator check this to pick the matching code path
+    backend = "grid"
     def __init__(self, fen=None):
         if fen:
             self.load_fen(fen)
         else:
             self._init_start_position()
+            self._init_piece_lists()
+        #64-bit position key, kept up to date by make_move/undo_move
+        self.zobrist_key = compute_key(self)
+        #Running material + piece-square score (white positive) with the
+        #middlegame and the endgame king table, see Evaluator
+        self.eval_mg, self.eval_eg, self.piece_count = compute_accumulators(self)
     def _init_start_position(self):
         #Standard chess starting position
         self.board = [
@@ -36,6 +54,19 @@ class Board:
         self.fullmoves = 1
         #Used for search and undoing moves
         self.move_stack = []
+        #Zobrist key before each move in move_stack, for repetition checks
+        self.hash_history = []
+    def _init_piece_lists(self):
+        #piece -> set of (row, col), so nothing has to scan empty squares
+        self.piece_squares = {piece: set() for piece in PIECES}
+        self.king_squares = {"w": None, "b": None}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.piece_squares[piece].add((r, c))
+                    if piece[1] == "K":
+                        self.king_squares[piece[0]] = (r, c)
     def get_board(self):
         for r in range(8):
             for c in range(8):
@@ -72,17 +103,21 @@ class Board:
             fen_rows.append(fen_row)
         board_part = "/".join(fen_rows)
         active_color = 'w' if self.white_to_move else 'b'
-        castling_part = ''.join([k for k, v in self.castle_rights.items() if v])
+        castle_symbols = {"wK": "K", "wQ": "Q", "bK": "k", "bQ": "q"}
+        castling_part = ''.join([castle_symbols[k] for k, v in self.castle_rights.items() if v])
         if castling_part == '':
             castling_part = '-'
-        en_passant_part = self.en_passant_square if self.en_passant_square else '-'
+        en_passant_part = '-'
+        if self.en_passant_square:
+            ep_row, ep_col = self.en_passant_square
+            en_passant_part = "abcdefgh"[ep_col] + str(8 - ep_row)
         fen = f"{board_part} {active_color} {castling_part} {en_passant_part} {self.halfmoves} {self.fullmoves}"
         return fen
     def load_fen(self, fen: str):
         parts = fen.split()
         board_part = parts[0]
         rows = board_part.split('/')
-        self.board = []
+        board = []
         for row in rows:
             board_row = []
             for char in row:
@@ -91,25 +126,49 @@ class Board:
                 else:
                     color = 'w' if char.isupper() else 'b'
                     piece = char.upper()
-                    self.board_row.append(color + piece)
-            self.board.append(board_row)
+                    board_row.append(color + piece)
+            board.append(board_row)
+        self.board = board
         self.white_to_move = (parts[1] == 'w')
-        self.castle_rights = parts[2]
-        self.en_passant_square = parts[3] if parts[3] != '-' else None
-        self.halfmoves = int(parts[4])
-        self.fullmoves = int(parts[5])
+        self.castle_rights = {
+            "wK": "K" in parts[2],
+            "wQ": "Q" in parts[2],
+            "bK": "k" in parts[2],
+            "bQ": "q" in parts[2]
+        }
+        #En passant is stored as (row, col) like every other square
+        self.en_passant_square = None
+        if len(parts) > 3 and parts[3] != '-':
+            self.en_passant_square = (8 - int(parts[3][1]), "abcdefgh".index(parts[3][0]))
+        self.halfmoves = int(parts[4]) if len(parts) > 4 else 0
+        self.fullmoves = int(parts[5]) if len(parts) > 5 else 1
+        self.move_stack = []
+        self.hash_history = []
+        self._init_piece_lists()
+        self.zobrist_key = compute_key(self)
+        self.eval_mg, self.eval_eg, self.piece_count = compute_accumulators(self)
     def current_board(self):
         return self.board
     def copy(self):
-        new_board = Board()
-        new_board.board = [row[:] for row in self.board]
+        new_board = self.__class__()
+        self._copy_pieces(new_board)
         new_board.white_to_move = self.white_to_move
         new_board.en_passant_square = self.en_passant_square
         new_board.castle_rights = self.castle_rights.copy()
         new_board.halfmoves = self.halfmoves
         new_board.fullmoves = self.fullmoves
         new_board.move_stack = self.move_stack[:]
+        new_board.hash_history = self.hash_history[:]
+        new_board.zobrist_key = self.zobrist_key
+        new_board.eval_mg = self.eval_mg
+        new_board.eval_eg = self.eval_eg
+        new_board.piece_count = self.piece_count
         return new_board
+    #Where the pieces are, the part of copy() that depends on the backend
+    def _copy_pieces(self, new_board):
+        new_board.board = [row[:] for row in self.board]
+        new_board.piece_squares = {piece: squares.copy() for piece, squares in self.piece_squares.items()}
+        new_board.king_squares = self.king_squares.copy()
     def get_piece(self, row, col) -> str:
         if 0 <= row < 8 and 0 <= col < 8:
             return self.board[row][col]
@@ -117,25 +176,51 @@ class Board:
             return ValueError("Row and Column must be between 0 and 7 inclusive.")
     def set_piece(self, row, col, piece: str):
         if 0 <= row < 8 and 0 <= col < 8:
+            old = self.board[row][col]
+            sq = row * 8 + col
+            if old != "--":
+                self.eval_mg -= SQUARE_SCORES_MG[old][sq]
+                self.eval_eg -= SQUARE_SCORES_EG[old][sq]
+                self.piece_count -= 1
+                self.piece_squares[old].discard((row, col))
+                if old[1] == "K" and self.king_squares[old[0]] == (row, col):
+                    self.king_squares[old[0]] = None
+            if piece != "--":
+                self.eval_mg += SQUARE_SCORES_MG[piece][sq]
+                self.eval_eg += SQUARE_SCORES_EG[piece][sq]
+                self.piece_count += 1
+                self.piece_squares[piece].add((row, col))
+                if piece[1] == "K":
+                    self.king_squares[piece[0]] = (row, col)
             self.board[row][col] = piece
         else:
             return ValueError("Row and Column must be between 0 and 7 inclusive.")
+    #Earlier occurrences of the current position. Only positions since the
+    #last capture or pawn move (the halfmove clock) with the same side to
+    #move can match, so the scan stops there
+    def repetition_count(self) -> int:
+        key = self.zobrist_key
+        history = self.hash_history
+        stop = max(0, len(history) - self.halfmoves)
+        count = 0
+        for i in range(len(history) - 2, stop - 1, -2):
+            if history[i] == key:
+                count += 1
+        return count
+    def is_repetition(self) -> bool:
+        key = self.zobrist_key
+        history = self.hash_history
+        stop = max(0, len(history) - self.halfmoves)
+        for i in range(len(history) - 2, stop - 1, -2):
+            if history[i] == key:
+                return True
+        return False
     def find_king(self, color:str) -> tuple:
-        king = "wK" if color == "w" else "bK"
-        #Kings typically won't move far from starting until end game
-        if king == "wK":
-            for r in range(7, -1, -1):
-                for c in range(7, -1, -1):
-                    if self.board[r][c] == king:
-                        return (r, c)
-        else:
-            for r in range(8):
-                for c in range(8):
-                    if self.board[r][c] == king:
-                        return (r, c)
-        return None
-    #Use Move class
+        return self.king_squares[color]
+    #Use Move class, a packed int from Move.encode() is also accepted
     def make_move(self, move: Move):
+        if type(move) is int:
+            move = Move.decode(move, self)
         state = (
             move, 
             move.moved_piece,
@@ -143,60 +228,95 @@ class Board:
             self.castle_rights.copy(),
             self.en_passant_square,
             self.halfmoves,   
-            self.fullmoves
+            self.fullmoves,
+            self.zobrist_key,
+            self.eval_mg,
+            self.eval_eg,
+            self.piece_count
         )
 
         self.move_stack.append(state)
+        self.hash_history.append(self.zobrist_key)
         
         piece = move.moved_piece
+        start_r, start_c = move.start
+        end_r, end_c = move.end
+        key = self.zobrist_key
+        piece_squares = self.piece_squares
+        start_sq = start_r * 8 + start_c
+        end_sq = end_r * 8 + end_c
+        mg = self.eval_mg
+        eg = self.eval_eg
+
+        target = self.board[end_r][end_c]
+        if target != "--":
+            key ^= PIECE_KEYS[target][end_sq]
+            piece_squares[target].discard(move.end)
+            mg -= SQUARE_SCORES_MG[target][end_sq]
+            eg -= SQUARE_SCORES_EG[target][end_sq]
+            self.piece_count -= 1
         
         if move.is_castling(piece):
             color = piece[0]
+            rook = color + "R"
             if move.end[1] == 6:
                 self.board[move.start[0]][7] = "--"
-                self.board[move.end[0]][5] = color + "R"
+                self.board[move.end[0]][5] = rook
+                key ^= PIECE_KEYS[rook][start_r * 8 + 7] ^ PIECE_KEYS[rook][end_r * 8 + 5]
+                piece_squares[rook].discard((start_r, 7))
+                piece_squares[rook].add((end_r, 5))
+                mg += SQUARE_SCORES_MG[rook][end_r * 8 + 5] - SQUARE_SCORES_MG[rook][start_r * 8 + 7]
+                eg += SQUARE_SCORES_EG[rook][end_r * 8 + 5] - SQUARE_SCORES_EG[rook][start_r * 8 + 7]
             elif move.end[1] == 2:
                 self.board[move.start[0]][0] = "--"
-                self.board[move.end[0]][3] = color + "R"
+                self.board[move.end[0]][3] = rook
+                key ^= PIECE_KEYS[rook][start_r * 8] ^ PIECE_KEYS[rook][end_r * 8 + 3]
+                piece_squares[rook].discard((start_r, 0))
+                piece_squares[rook].add((end_r, 3))
+                mg += SQUARE_SCORES_MG[rook][end_r * 8 + 3] - SQUARE_SCORES_MG[rook][start_r * 8]
+                eg += SQUARE_SCORES_EG[rook][end_r * 8 + 3] - SQUARE_SCORES_EG[rook][start_r * 8]
 
         self.board[move.start[0]][move.start[1]] = "--"
         self.board[move.end[0]][move.end[1]] = piece
+        key ^= PIECE_KEYS[piece][start_sq]
+        piece_squares[piece].discard(move.start)
+        mg -= SQUARE_SCORES_MG[piece][start_sq]
+        eg -= SQUARE_SCORES_EG[piece][start_sq]
 
+        placed = piece[0] + move.promotion if move.promotion else piece
+        key ^= PIECE_KEYS[placed][end_sq]
+        piece_squares[placed].add(move.end)
+        mg += SQUARE_SCORES_MG[placed][end_sq]
+        eg += SQUARE_SCORES_EG[placed][end_sq]
         if move.promotion:
-            self.board[move.end[0]][move.end[1]] = piece[0] + move.promotion
+            self.board[move.end[0]][move.end[1]] = placed
+        elif piece[1] == "K":
+            self.king_squares[piece[0]] = move.end
 
         old_en_passant = self.en_passant_square
+        if old_en_passant is not None:
+            key ^= EN_PASSANT_KEYS[old_en_passant[1]]
         
         #update en passant square
         if piece[1] == "P" and abs(move.start[0] - move.end[0]) == 2:
             self.en_passant_square = ((move.start[0] + move.end[0]) // 2, move.start[1])
+            key ^= EN_PASSANT_KEYS[start_c]
         else:
             self.en_passant_square = None
             
         #handle en passant capture
         if piece[1] == "P" and move.end == old_en_passant and old_en_passant is not None:
             captured_pawn_row = move.start[0]
+            captured_pawn = self.board[captured_pawn_row][move.end[1]]
             self.board[captured_pawn_row][move.end[1]] = "--"
+            key ^= PIECE_KEYS[captured_pawn][captured_pawn_row * 8 + end_c]
+            piece_squares[captured_pawn].discard((captured_pawn_row, end_c))
+            captured_sq = captured_pawn_row * 8 + end_c
+            mg -= SQUARE_SCORES_MG[captured_pawn][captured_sq]
+            eg -= SQUARE_SCORES_EG[captured_pawn][captured_sq]
+            self.piece_count -= 1
 
-        #Update castle rights
-        if piece[1] == "K":
-            if piece[0] == "w":
-                self.castle_rights["wK"] = False
-                self.castle_rights["wQ"] = False
-            else:
-                self.castle_rights["bK"] = False
-                self.castle_rights["bQ"] = False
-        elif piece[1] == "R":
-            if piece[0] == "w":
-                if move.start == (7, 0):
-                    self.castle_rights["wQ"] = False
-                elif move.start == (7, 7):
-                    self.castle_rights["wK"] = False
-            else:
-                if move.start == (0, 0):
-                    self.castle_rights["bQ"] = False
-                elif move.start == (0, 7):
-                    self.castle_rights["bK"] = False
+        key = self._update_castle_rights(move, piece, key)
         
         if piece[1] == "P" or move.piece_captured != "--":
             self.halfmoves = 0
@@ -207,32 +327,111 @@ class Board:
             self.fullmoves += 1 
         
         self.white_to_move = not self.white_to_move
+        self.zobrist_key = key ^ SIDE_KEY
+        self.eval_mg = mg
+        self.eval_eg = eg
+    #Takes away the castle rights the move loses, returns the updated key
+    def _update_castle_rights(self, move, piece, key) -> int:
+        rights = self.castle_rights
+        if piece[1] == "K":
+            if piece[0] == "w":
+                if rights["wK"]:
+                    key ^= CASTLE_KEYS["wK"]
+                if rights["wQ"]:
+                    key ^= CASTLE_KEYS["wQ"]
+                rights["wK"] = False
+                rights["wQ"] = False
+            else:
+                if rights["bK"]:
+                    key ^= CASTLE_KEYS["bK"]
+                if rights["bQ"]:
+                    key ^= CASTLE_KEYS["bQ"]
+                rights["bK"] = False
+                rights["bQ"] = False
+        #A rook leaving its corner or being captured there loses that side
+        for square in (move.start, move.end):
+            right = CASTLE_ROOK_SQUARES.get(square)
+            if right and rights[right]:
+                rights[right] = False
+                key ^= CASTLE_KEYS[right]
+        return key
+    #Passes the turn without moving, for null-move pruning. It goes on
+    #move_stack with no move, so undo_move takes it back like any other
+    def make_null_move(self):
+        self.move_stack.append((
+            None, None, None,
+            self.castle_rights,
+            self.en_passant_square,
+            self.halfmoves,
+            self.fullmoves,
+            self.zobrist_key,
+            self.eval_mg,
+            self.eval_eg,
+            self.piece_count
+        ))
+        self.hash_history.append(self.zobrist_key)
+        key = self.zobrist_key ^ SIDE_KEY
+        if self.en_passant_square is not None:
+            key ^= EN_PASSANT_KEYS[self.en_passant_square[1]]
+            self.en_passant_square = None
+        #Repetitions never count across a null move
+        self.halfmoves = 0
+        self.white_to_move = not self.white_to_move
+        self.zobrist_key = key
+    def undo_null_move(self):
+        self.undo_move()
     def undo_move(self):
         if not self.move_stack:
             return 
         state = self.move_stack.pop()
-        move, moved_piece, captured_piece, castling_rights, en_passant_square, halfmoves, fullmoves = state
+        self.hash_history.pop()
+        (move, moved_piece, captured_piece, castling_rights, en_passant_square,
+            halfmoves, fullmoves, zobrist_key, eval_mg, eval_eg, piece_count) = state
+        if move is None:
+            self.en_passant_square = en_passant_square
+            self.halfmoves = halfmoves
+            self.zobrist_key = zobrist_key
+            self.white_to_move = not self.white_to_move
+            return
+        piece_squares = self.piece_squares
+        #Whatever stands on the end square now is the moved or promoted piece
+        piece_squares[self.board[move.end[0]][move.end[1]]].discard(move.end)
+        piece_squares[moved_piece].add(move.start)
+        if moved_piece[1] == "K":
+            self.king_squares[moved_piece[0]] = move.start
         self.board[move.start[0]][move.start[1]] = moved_piece
         self.board[move.end[0]][move.end[1]] = captured_piece
         
         if move.is_castling(moved_piece):
             color = moved_piece[0]
+            rook_squares = piece_squares[color + "R"]
             if move.end[1] == 6:
                 self.board[move.end[0]][5] = "--"
                 self.board[move.start[0]][7] = color + "R"
+                rook_squares.discard((move.end[0], 5))
+                rook_squares.add((move.start[0], 7))
             elif move.end[1] == 2:
                 self.board[move.end[0]][3] = "--"
                 self.board[move.start[0]][0] = color + "R"
+                rook_squares.discard((move.end[0], 3))
+                rook_squares.add((move.start[0], 0))
         
         if moved_piece[1] == "P" and move.end == en_passant_square and en_passant_square is not None:
             captured_pawn_row = move.start[0]
             self.board[captured_pawn_row][move.end[1]] = captured_piece
             self.board[move.end[0]][move.end[1]] = "--"
+            piece_squares[captured_piece].add((captured_pawn_row, move.end[1]))
+        elif captured_piece != "--":
+            piece_squares[captured_piece].add(move.end)
             
         self.castle_rights = castling_rights
         self.en_passant_square = en_passant_square
         self.halfmoves = halfmoves
         self.fullmoves = fullmoves
+        self.zobrist_key = zobrist_key
+        self.eval_mg = eval_mg
+        self.eval_eg = eval_eg
+        self.piece_count = piece_count
         
         self.white_to_move = not self.white_to_move
     #Use Rules class
\ No newline at end of file
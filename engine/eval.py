@@ -1,87 +1,168 @@
+PIECE_VALUES = {
+    "P": 100,
+    "N": 320,
+    "B": 320,
+    "R": 500,
+    "Q": 900,
+    "K": 20000
+}
+
+PAWN_TABLE = [
+    [0,  5, 10, 15, 20, 25, 30, 0],
+    [5, 10, 15, 20, 25, 30, 35, 5],
+    [0, 10, 20, 25, 30, 35, 40, 0],
+    [0, 15, 25, 30, 35, 40, 45, 0],
+    [5, 20, 30, 35, 40, 45, 50, 5],
+    [10,25, 35, 40, 45, 50, 55,10],
+    [50,55, 60, 65, 70, 75,80,50],
+    [0, 0,   0,   0,   0,   0,   0,   0]
+]
+
+KNIGHT_TABLE = [
+    [-50,-40,-30,-30,-30,-30,-40,-50],
+    [-40,-20,  0,  0,  0,  0,-20,-40],
+    [-30,  0, 10, 15, 15, 10,  0,-30],
+    [-30,  5, 15, 20, 20, 15,  5,-30],
+    [-30,  0, 15, 20, 20, 15,  0,-30],
+    [-30,  5, 10, 15, 15, 10,  5,-30],
+    [-40,-20,  0,  5,  5,  0,-20,-40],
+    [-50,-40,-30,-30,-30,-30,-40,-50]
+]
+BISHOP_TABLE = [
+    [-20,-10,-10,-10,-10,-10,-10,-20],
+    [-10,  0,  0,  0,  0,  0,  0,-10],
+    [-10,  0,  5, 10, 10,  5,  0,-10],
+    [-10,  5,  5, 10, 10,  5,  5,-10],
+    [-10,  0, 10, 10, 10, 10,  0,-10],
+    [-10, 10, 10, 10, 10, 10, 10,-10],
+    [-10,  5,  0,  0,  0,  0,  5,-10],
+    [-20,-10,-10,-10,-10,-10,-10,-20]
+]
+
+ROOK_TABLE = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, 10, 10, 10, 10, 5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [0, 0, 0, 5, 5, 0, 0, 0]
+]
+QUEEN_TABLE = [
+    [-20,-10,-10, -5, -5,-10,-10,-20],
+    [-10,  0,  0,  0,  0,  0,  0,-10],
+    [-10,  0,  5,  5,  5,  5,  0,-10],
+    [ -5,  0,  5,  5,  5,  5,  0, -5],
+    [  0,  0,  5,  5,  5,  5,  0, -5],
+    [-10,  5,  5,  5,  5,  5,  0,-10],
+    [-10,  0,  5,  0,  0,  0,  0,-10],
+    [-20,-10,-10, -5, -5,-10,-10,-20]
+]
+
+KING_TABLE_MIDDLEGAME = [
+    [-30,-40,-40,-50,-50,-40,-40,-30],
+    [-30,-40,-40,-50,-50,-40,-40,-30],
+    [-30,-40,-40,-50,-50,-40,-40,-30],
+    [-30,-40,-40,-50,-50,-40,-40,-30],
+    [-20,-30,-30,-40,-40,-30,-30,-20],
+    [-10,-20,-20,-20,-20,-20,-20,-10],
+     [ 20, 20,  0,  0,  0,  0, 20, 20],
+     [ 20, 30, 10,  0,  0, 10, 30, 20]
+]
+KING_TABLE_ENDGAME = [
+    [-50,-40,-30,-20,-20,-30,-40,-50],
+    [-30,-20,-10,  0,  0,-10,-20,-30],
+    [-30,-10, 20, 30, 30, 20,-10,-30],
+    [-30,-10, 30, 40, 40, 30,-10,-30],
+    [-30,-10, 30, 40, 40, 30,-10,-30],
+    [-30,-10, 20, 30, 30, 20,-10,-30],
+    [-30,-30,  0,  0,  0,  0,-30,-30],
+    [-50,-40,-30,-20,-20,-30,-40,-50]
+]
+
+#Below this many pieces (kings included) the endgame king table is used
+ENDGAME_PIECE_COUNT = 16
+
+PIECE_TABLES = {
+    "P": PAWN_TABLE,
+    "N": KNIGHT_TABLE,
+    "B": BISHOP_TABLE,
+    "R": ROOK_TABLE,
+    "Q": QUEEN_TABLE
+}
+
+def _signed_square_scores(king_table):
+    #piece -> 64 scores (value + table) by row * 8 + col, negative for black
+    scores = {}
+    for color, sign in (("w", 1), ("b", -1)):
+        for piece_type, value in PIECE_VALUES.items():
+            table = king_table if piece_type == "K" else PIECE_TABLES[piece_type]
+            squares = []
+            for r in range(8):
+                table_row = r if color == "w" else 7 - r
+                for c in range(8):
+                    squares.append(sign * (value + table[table_row][c]))
+            scores[color + piece_type] = squares
+    return scores
+
+#Used by Board to update its running scores in make_move
+SQUARE_SCORES_MG = _signed_square_scores(KING_TABLE_MIDDLEGAME)
+SQUARE_SCORES_EG = _signed_square_scores(KING_TABLE_ENDGAME)
+
+def compute_accumulators(board) -> tuple:
+    #Full recompute of (middlegame, endgame, piece count) for a new position
+    mg = 0
+    eg = 0
+    count = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board.get_piece(r, c)
+            if piece != "--":
+                mg += SQUARE_SCORES_MG[piece][r * 8 + c]
+                eg += SQUARE_SCORES_EG[piece][r * 8 + c]
+                count += 1
+    return mg, eg, count
+
+#Piece codes for batch encoding, 0 is an empty square
+BATCH_PIECES = ["--", "wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+BATCH_CODES = {piece: code for code, piece in enumerate(BATCH_PIECES)}
+
+#NumPy is only needed for batch evaluation, so it is imported on first use
+def encode_boards(boards):
+    #(N, 64) int8 array of piece codes, squares by row * 8 + col
+    import numpy as np
+    encoded = np.zeros((len(boards), 64), dtype=np.int8)
+    for i, board in enumerate(boards):
+        for piece, squares in board.piece_squares.items():
+            code = BATCH_CODES[piece]
+            for r, c in squares:
+                encoded[i, r * 8 + c] = code
+    return encoded
+
+def _batch_tables(square_scores):
+    #(13, 64) lookup of signed value + table score, the empty row is zero
+    import numpy as np
+    table = np.zeros((len(BATCH_PIECES), 64), dtype=np.int32)
+    for piece, code in BATCH_CODES.items():
+        if code:
+            table[code] = square_scores[piece]
+    return table
+
 class Evaluator:
-    def __init__(self):
-        self.piece_values = {
-            "P": 100,
-            "N": 320,
-            "B": 320,
-            "R": 500,
-            "Q": 900,
-            "K": 20000
-        }
-        
-        self.pawn_table = [
-            [0,  5, 10, 15, 20, 25, 30, 0],
-            [5, 10, 15, 20, 25, 30, 35, 5],
-            [0, 10, 20, 25, 30, 35, 40, 0],
-            [0, 15, 25, 30, 35, 40, 45, 0],
-            [5, 20, 30, 35, 40, 45, 50, 5],
-            [10,25, 35, 40, 45, 50, 55,10],
-            [50,55, 60, 65, 70, 75,80,50],
-            [0, 0,   0,   0,   0,   0,   0,   0]
-        ]
-        
-        self.knight_table = [
-            [-50,-40,-30,-30,-30,-30,-40,-50],
-            [-40,-20,  0,  0,  0,  0,-20,-40],
-            [-30,  0, 10, 15, 15, 10,  0,-30],
-            [-30,  5, 15, 20, 20, 15,  5,-30],
-            [-30,  0, 15, 20, 20, 15,  0,-30],
-            [-30,  5, 10, 15, 15, 10,  5,-30],
-            [-40,-20,  0,  5,  5,  0,-20,-40],
-            [-50,-40,-30,-30,-30,-30,-40,-50]
-        ]
-        self.bishop_table = [
-            [-20,-10,-10,-10,-10,-10,-10,-20],
-            [-10,  0,  0,  0,  0,  0,  0,-10],
-            [-10,  0,  5, 10, 10,  5,  0,-10],
-            [-10,  5,  5, 10, 10,  5,  5,-10],
-            [-10,  0, 10, 10, 10, 10,  0,-10],
-            [-10, 10, 10, 10, 10, 10, 10,-10],
-            [-10,  5,  0,  0,  0,  0,  5,-10],
-            [-20,-10,-10,-10,-10,-10,-10,-20]
-        ]
-        
-        self.rook_table = [
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [5, 10, 10, 10, 10, 10, 10, 5],
-            [-5, 0, 0, 0, 0, 0, 0, -5],
-            [-5, 0, 0, 0, 0, 0, 0, -5],
-            [-5, 0, 0, 0, 0, 0, 0, -5],
-            [-5, 0, 0, 0, 0, 0, 0, -5],
-            [-5, 0, 0, 0, 0, 0, 0, -5],
-            [0, 0, 0, 5, 5, 0, 0, 0]
-        ]
-        self.queen_table = [
-            [-20,-10,-10, -5, -5,-10,-10,-20],
-            [-10,  0,  0,  0,  0,  0,  0,-10],
-            [-10,  0,  5,  5,  5,  5,  0,-10],
-            [ -5,  0,  5,  5,  5,  5,  0, -5],
-            [  0,  0,  5,  5,  5,  5,  0, -5],
-            [-10,  5,  5,  5,  5,  5,  0,-10],
-            [-10,  0,  5,  0,  0,  0,  0,-10],
-            [-20,-10,-10, -5, -5,-10,-10,-20]
-        ]
-        
-        self.king_table_middlegame = [
-            [-30,-40,-40,-50,-50,-40,-40,-30],
-            [-30,-40,-40,-50,-50,-40,-40,-30],
-            [-30,-40,-40,-50,-50,-40,-40,-30],
-            [-30,-40,-40,-50,-50,-40,-40,-30],
-            [-20,-30,-30,-40,-40,-30,-30,-20],
-            [-10,-20,-20,-20,-20,-20,-20,-10],
-             [ 20, 20,  0,  0,  0,  0, 20, 20],
-             [ 20, 30, 10,  0,  0, 10, 30, 20]
-        ]
-        self.king_table_endgame = [
-            [-50,-40,-30,-20,-20,-30,-40,-50],
-            [-30,-20,-10,  0,  0,-10,-20,-30],
-            [-30,-10, 20, 30, 30, 20,-10,-30],
-            [-30,-10, 30, 40, 40, 30,-10,-30],
-            [-30,-10, 30, 40, 40, 30,-10,-30],
-            [-30,-10, 20, 30, 30, 20,-10,-30],
-            [-30,-30,  0,  0,  0,  0,-30,-30],
-            [-50,-40,-30,-20,-20,-30,-40,-50]
-        ]
+    #debug: check the board's incremental scores against a full recompute
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.piece_values = PIECE_VALUES
+        self.pawn_table = PAWN_TABLE
+        self.knight_table = KNIGHT_TABLE
+        self.bishop_table = BISHOP_TABLE
+        self.rook_table = ROOK_TABLE
+        self.queen_table = QUEEN_TABLE
+        self.king_table_middlegame = KING_TABLE_MIDDLEGAME
+        self.king_table_endgame = KING_TABLE_ENDGAME
+        #NumPy lookups for evaluate_batch, built on first use
+        self.batch_tables = None
 
     def evaluate(self, board):
         score = 0
@@ -90,25 +171,51 @@ class Evaluator:
 
         return score
     
+    #Same scores as evaluate() for many boards at once, as an int32 array.
+    #Takes boards or an already encoded (N, 64) array from encode_boards
+    def evaluate_batch(self, boards):
+        import numpy as np
+        if self.batch_tables is None:
+            self.batch_tables = (_batch_tables(SQUARE_SCORES_MG), _batch_tables(SQUARE_SCORES_EG))
+        table_mg, table_eg = self.batch_tables
+        encoded = boards if isinstance(boards, np.ndarray) else encode_boards(boards)
+        codes = encoded.astype(np.intp)
+        squares = np.arange(64)
+        mg = table_mg[codes, squares].sum(axis=1)
+        eg = table_eg[codes, squares].sum(axis=1)
+        piece_count = np.count_nonzero(encoded, axis=1)
+        return np.where(piece_count >= ENDGAME_PIECE_COUNT, mg, eg).astype(np.int32)
+    #Board keeps material + piece-square sums for both king tables up to date
     def evaluate_material_and_position(self, board):
+        score = board.eval_mg if board.piece_count >= ENDGAME_PIECE_COUNT else board.eval_eg
+        if self.debug:
+            full_score = self.compute_material_and_position(board)
+            if full_score != score:
+                raise RuntimeError(f"Incremental eval {score} != recomputed {full_score} for {board.to_fen()}")
+        return score
+    def compute_material_and_position(self, board):
         score = 0
-        piece_count = 0
-        for r in range(8):
-            for c in range(8):
-                piece = board.get_piece(r,c)
-                if piece != "--":
-                    piece_count += 1
-                    piece_type = piece[1]
-                    piece_color = piece[0]
-                    
-                    piece_value = self.piece_values[piece_type]
-                    positional_value = self.get_positional_val(piece_type, r, c, piece_color, piece_count)
-                    
-                    if piece_color == "w":
-                        score += piece_value + positional_value
-                    else:
-                        score -= piece_value + positional_value
+        pieces = self.get_pieces(board)
+        #King table depends on how much material is left on the whole board
+        piece_count = len(pieces)
+        for piece, r, c in pieces:
+            piece_type = piece[1]
+            piece_color = piece[0]
+            
+            piece_value = self.piece_values[piece_type]
+            positional_value = self.get_positional_val(piece_type, r, c, piece_color, piece_count)
+            
+            if piece_color == "w":
+                score += piece_value + positional_value
+            else:
+                score -= piece_value + positional_value
         return score
+    def get_pieces(self, board) -> list:
+        pieces = []
+        for piece, squares in board.piece_squares.items():
+            for r, c in squares:
+                pieces.append((piece, r, c))
+        return pieces
     def get_positional_val(self, pt, r, c, color, pc):
         table_row = r if color == "w" else 7 - r
         
@@ -123,7 +230,7 @@ class Evaluator:
         elif pt == 'Q':
             return self.queen_table[table_row][c]
         elif pt == 'K':
-            if pc >= 16:
+            if pc >= ENDGAME_PIECE_COUNT:
                 return self.king_table_middlegame[table_row][c]
             else:
                 return self.king_table_endgame[table_row][c]
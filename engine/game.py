@@ -1,39 +1,80 @@
-from engine.board import Board
+from engine.bitboard import new_board
 from engine.rules import Rules
 from engine.eval import Evaluator
 from engine.search import Search
 from engine.move import Move
+from engine.worker import SearchWorker
+from engine.book import OpeningBook
+from engine.tablebase import Tablebase
 class Game:
-    def __init__(self, player_color="w", ai_depth = 4):
-        self.board = Board()
+    def __init__(self, player_color="w", ai_depth = 4, backend="grid", ai_movetime=None, ponder=False,
+                 book_path=None, book_mode="weighted", tablebase_path=None):
+        #"grid" uses the 8x8 string board, "bitboard" BitBoard, which keeps
+        #the position in 64-bit piece sets
+        self.backend = backend
+        self.board = self.new_board()
         self.rules = Rules(self.board)
         self.evaluator = Evaluator()
-        self.search = Search(self.board, self.rules, self.evaluator)
+        #Directory of generated endgame tables, see engine.tablebase
+        self.tablebase = Tablebase(tablebase_path) if tablebase_path else None
+        self.search = Search(self.board, self.rules, self.evaluator, tablebase=self.tablebase)
         
         self.player_color = player_color
         self.ai_color = "b" if player_color == "w" else "w"
         self.ai_depth = ai_depth
+        #Milliseconds per AI move, when set it replaces the fixed ai_depth
+        self.ai_movetime = ai_movetime
+        #Search the predicted reply while the player thinks
+        self.ponder = ponder
+        self.ponder_worker = None
+        self.ponder_move = None
+        self.ponder_hit = False
+        #Polyglot opening book, checked before searching. book_mode: "weighted" or "best"
+        self.book = OpeningBook(book_path) if book_path else None
+        self.book_mode = book_mode
         
         self.game_over = False
         self.winner = None
         self.game_over_reason = None
         
         self.move_history = []
+        #Legal moves and check status of the position with the stored key
+        self.position_cache = {}
         
     def is_player_turn(self):
         return self.board.white_to_move == (self.player_color == "w")
     def is_ai_turn(self):
         return not self.is_player_turn()
+    #Worked out once per position: any move or undo changes the key, so a
+    #stale entry is never used. The returned list is shared, don't modify it.
+    #The ply is part of the key because repetitions depend on the history
+    def get_position_info(self) -> dict:
+        key = (self.board.zobrist_key, len(self.board.hash_history))
+        if self.position_cache.get("key") != key:
+            color = "w" if self.board.white_to_move else "b"
+            self.position_cache = {
+                "key": key,
+                "legal_moves": self.rules.generate_legal_moves(color),
+                "in_check": self.rules.in_check(color)
+            }
+        return self.position_cache
+    def clear_position_cache(self):
+        self.position_cache = {}
     def get_legal_moves(self):
-        color = "w" if self.board.white_to_move else "b"
-        return self.rules.generate_legal_moves(color)
+        return self.get_position_info()["legal_moves"]
+    def is_in_check(self) -> bool:
+        return self.get_position_info()["in_check"]
     def is_legal_move(self, move):
+        return self.find_legal_move(move) is not None
+    #The generated legal move matching move's squares and promotion, it
+    #carries the right captured piece for en passant
+    def find_legal_move(self, move):
         legal_moves = self.get_legal_moves()
         
         for legal_move in legal_moves:
             if (move.start == legal_move.start and move.end == legal_move.end and move.promotion == legal_move.promotion):
-                return True
-        return False
+                return legal_move
+        return None
     def make_player_move(self, start, end, promo=None):
         if self.game_over:
             return False
@@ -42,13 +83,14 @@ class Game:
         
         moved_piece = self.board.get_piece(start[0], start[1])
         captured_piece = self.board.get_piece(end[0], end[1])
-        move = Move(start, end, moved_piece, captured_piece, promo)
+        move = self.find_legal_move(Move(start, end, moved_piece, captured_piece, promo))
         
-        if not self.is_legal_move(move):
+        if move is None:
             return False
         
         self.board.make_move(move)
         self.move_history.append(move)
+        self.check_ponder(move)
         
         self.check_game_state()
         
@@ -60,46 +102,170 @@ class Game:
             return False
         
         print("AI thinking...")
-        best_move = self.search.find_best_move(self.ai_depth)
+        worker, instant_move = self.take_ready_move()
+        if worker is not None:
+            best_move = worker.wait()
+            pv = worker.search.pv
+        elif instant_move is not None:
+            best_move = instant_move
+            pv = []
+        else:
+            best_move = self.search.find_best_move(**self.get_ai_limits())
+            pv = self.search.pv
         
         if best_move is None:
             self.check_game_state()
             return None
         self.board.get_board()
         
-        self.board.make_move(best_move)
+        self.apply_ai_move(best_move, pv)
         print()
         self.board.get_board()
         self.board.get_last_five()
 
-        self.move_history.append(best_move)
         print("AI played move")
-        self.check_game_state()
         
         return best_move
+    def get_book_move(self):
+        if self.book is None:
+            return None
+        return self.book.get_move(self.board, self.rules, self.book_mode)
+    #Perfect play once the position is in the endgame tables
+    def get_tablebase_move(self):
+        if self.tablebase is None:
+            return None
+        return self.tablebase.best_move(self.board, self.rules)
+    #What the AI plays without starting a search, in this order: a ponder
+    #search the player's move hit, the opening book, the endgame tables.
+    #Returns (worker, instant_move), both None when a search is needed
+    def take_ready_move(self) -> tuple:
+        worker = self.take_ponder_hit()
+        if worker is not None:
+            return worker, None
+        instant_move = self.get_book_move()
+        if instant_move is None:
+            instant_move = self.get_tablebase_move()
+        return None, instant_move
+    #Search limits for the AI, a time budget replaces the fixed depth when set
+    def get_ai_limits(self) -> dict:
+        if self.ai_movetime:
+            return {"movetime": self.ai_movetime}
+        return {"depth": self.ai_depth}
+    #Same choice as make_ai_move but searches run in a background thread,
+    #poll the returned worker and hand its move to apply_ai_move. Book and
+    #tablebase moves are played straight away and None is returned
+    def start_ai_search(self):
+        if self.game_over or not self.is_ai_turn():
+            return None
+        worker, instant_move = self.take_ready_move()
+        if worker is not None:
+            return worker
+        if instant_move is not None:
+            self.apply_ai_move(instant_move)
+            return None
+        worker = SearchWorker(self.board, self.evaluator, self.search.tt, self.tablebase, **self.get_ai_limits())
+        return worker.start()
+    #pv: the search's expected line, its second move is pondered on
+    def apply_ai_move(self, move, pv=None):
+        if move is None:
+            self.check_game_state()
+            return
+        self.board.make_move(move)
+        self.move_history.append(move)
+        self.check_game_state()
+        if pv:
+            self.start_ponder(pv)
+    #Plays the predicted player reply on a copy of the board and searches
+    #the result in the background until the player actually moves
+    def start_ponder(self, pv):
+        self.stop_ponder()
+        if not self.ponder or self.game_over or len(pv) < 2:
+            return None
+        predicted = self.find_legal_move(pv[1])
+        if predicted is None:
+            return None
+        board = self.board.copy()
+        board.make_move(predicted)
+        self.ponder_move = predicted
+        self.ponder_worker = SearchWorker(board, self.evaluator, self.search.tt, self.tablebase,
+                                          ponder=True, **self.get_ai_limits())
+        return self.ponder_worker.start()
+    #On a ponder hit the running search becomes the AI's search, on a miss it is dropped
+    def check_ponder(self, move):
+        if self.ponder_worker is None:
+            return
+        predicted = self.ponder_move
+        if (move.start == predicted.start and move.end == predicted.end and
+                move.promotion == predicted.promotion):
+            self.ponder_hit = True
+            self.ponder_worker.search.ponderhit()
+        else:
+            self.stop_ponder()
+    def take_ponder_hit(self):
+        if not self.ponder_hit:
+            return None
+        worker = self.ponder_worker
+        self.ponder_worker = None
+        self.ponder_move = None
+        self.ponder_hit = False
+        return worker
+    def stop_ponder(self):
+        if self.ponder_worker is not None:
+            self.ponder_worker.cancel()
+        self.ponder_worker = None
+        self.ponder_move = None
+        self.ponder_hit = False
+    #Takes back the last player move, and the AI reply to it if there was one
+    def undo_last_move(self):
+        self.stop_ponder()
+        if not self.move_history:
+            return False
+        self.board.undo_move()
+        self.move_history.pop()
+        if self.is_ai_turn() and self.move_history:
+            self.board.undo_move()
+            self.move_history.pop()
+        
+        self.game_over = False
+        self.winner = None
+        self.game_over_reason = None
+        return True
     def check_game_state(self):
+        info = self.get_position_info()
+        if "result" not in info:
+            info["result"] = self.find_game_result()
+        result = info["result"]
+        if result is not None:
+            self.game_over = True
+            self.winner, self.game_over_reason = result
+        #game_over may have changed, the status text is rebuilt on demand
+        info.pop("status", None)
+    #(winner, reason) if the current position ends the game, else None
+    def find_game_result(self):
         color = "w" if self.board.white_to_move else "b"
-        legal_moves = self.rules.generate_legal_moves(color)
+        legal_moves = self.get_legal_moves()
         if not legal_moves:
-            if self.rules.in_check(color):
-                self.game_over = True
-                self.winner = "b" if color == "w" else "w"
-                self.game_over_reason = "checkmate"
+            if self.is_in_check():
+                return ("b" if color == "w" else "w"), "checkmate"
             else:
-                self.game_over = True
-                self.winner = None
-                self.game_over_reason = "stalemate"
+                return None, "stalemate"
                 
+        elif self.board.repetition_count() >= 2:
+            return None, "threefold repetition"
+        
         elif self.board.halfmoves >= 50:
-            self.game_over = True
-            self.winner = None
-            self.game_over_reason = "fifty-move rule"
+            return None, "fifty-move rule"
         
         elif self.is_insufficient_material():
-            self.game_over = True
-            self.winner = None
-            self.game_over_reason = "insufficient material"
+            return None, "insufficient material"
+        return None
+    #Text for the status bar, cached with the position since it is drawn every frame
     def get_game_status(self):
+        info = self.get_position_info()
+        if "status" not in info:
+            info["status"] = self.describe_game_status()
+        return info["status"]
+    def describe_game_status(self):
         if self.game_over:
             if self.winner:
                 winner_name = "White" if self.winner == "w" else "Black"
@@ -107,8 +273,7 @@ class Game:
             else:
                 return f"Game over: Draw by {self.game_over_reason}."
         curr_player = "White" if self.board.white_to_move else "Black"
-        color = "w" if self.board.white_to_move else "b"
-        if self.rules.in_check(color):
+        if self.is_in_check():
             return f"CHECK -- {curr_player} to move."
         return f"{curr_player} to move."
     def is_insufficient_material(self):
@@ -116,18 +281,18 @@ class Game:
         black_pieces = []
         white_bishops = []
         black_bishops = []
-        for r in range(8):
-            for c in range(8):
-                piece = self.board.get_piece(r,c)
-                if piece != "--" and piece[1] != 'K':
-                    if piece[0] == 'w':
-                        white_pieces.append(piece[1])
-                        if piece[1] == 'B':
-                            white_bishops.append((r + c) % 2)
-                    else:
-                        black_pieces.append(piece[1])
-                        if piece[1] == 'B':
-                            black_bishops.append((r + c) % 2)
+        for piece, squares in self.board.piece_squares.items():
+            if piece[1] == 'K':
+                continue
+            for r, c in squares:
+                if piece[0] == 'w':
+                    white_pieces.append(piece[1])
+                    if piece[1] == 'B':
+                        white_bishops.append((r + c) % 2)
+                else:
+                    black_pieces.append(piece[1])
+                    if piece[1] == 'B':
+                        black_bishops.append((r + c) % 2)
         total_pieces = len(white_pieces) + len(black_pieces)
         if total_pieces == 0:
             return True
@@ -142,11 +307,15 @@ class Game:
                     return True
         return False
                 
+    def new_board(self):
+        return new_board(backend=self.backend)
     def reset_game(self):
-        self.board = Board()
+        self.stop_ponder()
+        self.board = self.new_board()
+        self.clear_position_cache()
         self.rules = Rules(self.board)
         self.evaluator = Evaluator()
-        self.search = Search(self.board, self.rules, self.evaluator)
+        self.search = Search(self.board, self.rules, self.evaluator, tablebase=self.tablebase)
         
         self.game_over = False
         self.winner = None
@@ -158,10 +327,12 @@ class Game:
     def get_board_fen(self):
         return self.board.to_fen()
     def loard_position(self, fen):
+        self.stop_ponder()
         self.board.load_fen(fen)
+        self.clear_position_cache()
         self.rules = Rules(self.board)
         self.evaluator = Evaluator()
-        self.search = Search(self.board, self.rules, self.evaluator)
+        self.search = Search(self.board, self.rules, self.evaluator, tablebase=self.tablebase)
         
         self.game_over = False
         self.winner = None
@@ -1,4 +1,12 @@
+#Packed move: bits 0-5 from square, 6-11 to square (row * 8 + col),
+#12-14 promotion piece, 15 capture. Moved and captured pieces come from the board
+PROMOTION_PIECES = [None, "N", "B", "R", "Q"]
+PROMOTION_CODES = {piece: code for code, piece in enumerate(PROMOTION_PIECES)}
+CAPTURE_FLAG = 1 << 15
+
 class Move:
+    __slots__ = ("start", "end", "moved_piece", "piece_captured", "promotion")
+
     def __init__(self, start_pos, end_pos, moved_piece, piece_captured="--", promotion=None):
         self.start = start_pos
         self.end = end_pos
@@ -7,7 +15,7 @@ class Move:
         self.promotion = promotion
     def is_capture(self):
         return self.piece_captured != "--"
-    
+
     def is_promotion(self):
         return self.promotion is not None
 
@@ -16,6 +24,34 @@ class Move:
             piece[1] == "K" and
             abs(self.start[1] - self.end[1]) == 2
         )
-    
+    #Long algebraic notation as used by UCI, e.g. e2e4 or e7e8q
+    def to_uci(self) -> str:
+        files = "abcdefgh"
+        text = files[self.start[1]] + str(8 - self.start[0]) + files[self.end[1]] + str(8 - self.end[0])
+        if self.promotion:
+            text += self.promotion.lower()
+        return text
+    def encode(self) -> int:
+        code = (self.start[0] * 8 + self.start[1]) | ((self.end[0] * 8 + self.end[1]) << 6)
+        code |= PROMOTION_CODES[self.promotion] << 12
+        if self.piece_captured != "--":
+            code |= CAPTURE_FLAG
+        return code
+    #Rebuilds the full move for the position it was encoded in
+    @classmethod
+    def decode(cls, code: int, board) -> "Move":
+        from_sq = code & 63
+        to_sq = (code >> 6) & 63
+        start = (from_sq >> 3, from_sq & 7)
+        end = (to_sq >> 3, to_sq & 7)
+        moved_piece = board.get_piece(start[0], start[1])
+        captured = "--"
+        if code & CAPTURE_FLAG:
+            captured = board.get_piece(end[0], end[1])
+            if captured == "--":
+                #En passant, the pawn is beside the mover rather than on the end square
+                captured = board.get_piece(start[0], end[1])
+        return cls(start, end, moved_piece, captured, PROMOTION_PIECES[(code >> 12) & 7])
+
     def __str__(self):
-        return f"{self.start} to {self.end}, captured: {self.piece_captured}, promotion: {self.promotion}"
\ No newline at end of file
+        return f"{self.start} to {self.end}, captured: {self.piece_captured}, promotion: {self.promotion}"
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+from engine.bitboard import new_board
+from engine.rules import Rules
+from engine.eval import Evaluator
+from engine.search import Search, MATE_SCORE, MATE_THRESHOLD
+
+#Runs in a worker process: rebuild the position, play one root move and
+#search the reply. Returns (root move, score for the side at the root, nodes)
+def search_root_move(task):
+    fen, moves, root_move, depth, movetime, backend = task
+    board = new_board(fen, backend)
+    rules = Rules(board)
+    for text in moves:
+        board.make_move(rules.move_from_uci(text))
+    board.make_move(rules.move_from_uci(root_move))
+
+    search = Search(board, rules, Evaluator())
+    search.verbose = False
+    color = "w" if board.white_to_move else "b"
+    if not rules.generate_legal_moves(color):
+        #The root move ended the game
+        score = MATE_SCORE - 1 if rules.in_check(color) else 0
+        return root_move, score, 0
+    if depth is not None and depth <= 1:
+        #Nothing left to search below the root move, only settle captures
+        score = -search.quiescence(float('-inf'), float('inf'), 1)
+        return root_move, score, search.qnodes
+    search.find_best_move(depth - 1 if depth is not None else None, movetime=movetime)
+    nodes = search.nodes_searched + search.qnodes
+    score = -search.best_score if search.best_score is not None else 0
+    #The reply's mate distance counts from the position after the root
+    #move, one ply further from the root
+    if score > MATE_THRESHOLD:
+        score -= 1
+    elif score < -MATE_THRESHOLD:
+        score += 1
+    return root_move, score, nodes
+
+class ParallelSearch:
+    #Root splitting: every root move is searched in its own worker process,
+    #each with its own Board/Rules/Evaluator, and the best score wins
+    def __init__(self, processes=None, backend="grid"):
+        self.processes = processes or os.cpu_count() or 1
+        self.backend = backend
+        self.pool = None
+        self.nodes_searched = 0
+        self.best_score = None
+    def start(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+    def __enter__(self):
+        self.start()
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    #Position given as a FEN plus UCI moves played from it.
+    #movetime (milliseconds) is the budget for the whole search
+    def search(self, fen, moves=(), depth=None, movetime=None) -> tuple:
+        board = new_board(fen, self.backend)
+        rules = Rules(board)
+        for text in moves:
+            board.make_move(rules.move_from_uci(text))
+        color = "w" if board.white_to_move else "b"
+        root_moves = [move.to_uci() for move in rules.generate_legal_moves(color)]
+        self.nodes_searched = 0
+        self.best_score = None
+        if not root_moves:
+            return None, None
+        if depth is None and movetime is None:
+            depth = 4
+        move_time = None
+        if movetime is not None:
+            #Root moves run processes at a time, split the budget across the rounds
+            rounds = -(-len(root_moves) // self.processes)
+            move_time = max(1, movetime / rounds)
+
+        self.start()
+        tasks = [(fen, list(moves), move, depth, move_time, self.backend) for move in root_moves]
+        best_move = None
+        best_score = None
+        for move, score, nodes in self.pool.imap_unordered(search_root_move, tasks):
+            self.nodes_searched += nodes
+            #Ties go to the earlier generated move so the result does not
+            #depend on which worker finished first
+            if (best_score is None or score > best_score or
+                    (score == best_score and root_moves.index(move) < root_moves.index(best_move))):
+                best_move, best_score = move, score
+        self.best_score = best_score
+        return best_move, best_score
+    #Workers get the game's first position and its moves rather than the
+    #current FEN, so they see the history for repetition draws
+    def find_best_move(self, board, depth=None, movetime=None):
+        start = board.copy()
+        while start.move_stack:
+            start.undo_move()
+        moves = [state[0].to_uci() for state in board.move_stack]
+        best, _ = self.search(start.to_fen(), moves, depth=depth, movetime=movetime)
+        if best is None:
+            return None
+        return Rules(board).move_from_uci(best)
@@ -0,0 +1,102 @@
+import argparse
+import sys
+import time
+from engine.bitboard import new_board
+from engine.rules import Rules
+
+#name, fen, known node counts for depth 1, 2, 3...
+PERFT_POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594]),
+]
+
+#Leaf nodes of the legal move tree, depth 1 is counted without making moves
+def perft(board, rules, depth) -> int:
+    color = "w" if board.white_to_move else "b"
+    moves = rules.generate_legal_moves(color)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, rules, depth - 1)
+        board.undo_move()
+    return nodes
+
+#Perft split by root move, for finding the move a generator gets wrong
+def divide(board, rules, depth) -> dict:
+    color = "w" if board.white_to_move else "b"
+    counts = {}
+    for move in rules.generate_legal_moves(color):
+        board.make_move(move)
+        counts[move.to_uci()] = perft(board, rules, depth - 1)
+        board.undo_move()
+    return counts
+
+def run_perft(fen, depth, backend="grid") -> tuple:
+    board = new_board(fen, backend)
+    rules = Rules(board)
+    start = time.perf_counter()
+    nodes = perft(board, rules, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed
+
+#Runs every standard position to depth (or its deepest known count),
+#returns True when all counts match
+def run_suite(depth, backend="grid", out=sys.stdout) -> bool:
+    passed = True
+    total_nodes = 0
+    total_time = 0
+    for name, fen, expected in PERFT_POSITIONS:
+        d = min(depth, len(expected))
+        nodes, elapsed = run_perft(fen, d, backend)
+        total_nodes += nodes
+        total_time += elapsed
+        ok = nodes == expected[d - 1]
+        passed = passed and ok
+        status = "ok" if ok else f"FAIL (expected {expected[d - 1]})"
+        out.write(f"{name:<10} depth {d}  {nodes:>9} nodes  {elapsed:7.2f}s  {nodes_per_second(nodes, elapsed):>8} nps  {status}\n")
+    out.write(f"total      {total_nodes} nodes  {total_time:.2f}s  {nodes_per_second(total_nodes, total_time)} nps\n")
+    return passed
+
+def nodes_per_second(nodes, elapsed) -> int:
+    return int(nodes / elapsed) if elapsed > 0 else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move generator perft counts and speed.")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="position to count instead of the standard suite")
+    parser.add_argument("--divide", action="store_true", help="print the count under each root move")
+    parser.add_argument("--backend", choices=["grid", "bitboard"], default="grid")
+    args = parser.parse_args(argv)
+
+    if args.fen is None and not args.divide:
+        return 0 if run_suite(args.depth, args.backend) else 1
+
+    fen = args.fen or PERFT_POSITIONS[0][1]
+    board = new_board(fen, args.backend)
+    rules = Rules(board)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(board, rules, args.depth)
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, rules, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"nodes {nodes}  time {elapsed:.2f}s  nps {nodes_per_second(nodes, elapsed)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
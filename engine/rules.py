@@ -1,12 +1,14 @@
+from operator import attrgetter
 from engine.move import Move
-from engine.eval import Evaluator
+MOVE_END = attrgetter("end")
 class Rules:
     def __init__(self, board):
         self.board = board
         
+        #Leaper offsets in square order, so targets come out sorted
         self.knight_moves = [
-            (-2, -1), (-2, 1), (2, -1), (2, 1),
-            (-1, -2), (-1, 2), (1, -2), (1, 2)
+            (-2, -1), (-2, 1), (-1, -2), (-1, 2),
+            (1, -2), (1, 2), (2, -1), (2, 1)
         ]
         
         self.king_moves = [
@@ -21,46 +23,61 @@ class Rules:
     
     #board:array, square:tuple, attacking_color:str
     def is_square_attacked(self, board, square, attacking_color):
-        for r in range(8):
-            for c in range(8):
-                piece = board.get_piece(r,c)
-                if piece[0] != attacking_color[0] or piece[0] == "-":
-                    continue
-                if piece[1] == "P":
-                    direction = -1 if attacking_color == "w" else 1
-                    if r + direction == square[0]:
-                        if c - 1 == square[1] or c + 1 == square[1]:
-                            return True
-                elif piece[1] == "N":
-                    for dr, dc in self.knight_moves:
-                        if (r+dr, c+dc) == square:
-                            return True
-                elif piece[1] in ["B", "Q", "R"]:
-                        direction = []
-                        if piece[1] in ["B", "Q"]:
-                            direction += self.bishop_directions
-                        if piece[1] in ["R", "Q"]:
-                            direction += self.rook_directions
-                        for dr, dc in direction:
-                            nr, nc = r + dr, c + dc
-                            while 0 <= nr < 8 and 0 <= nc < 8:
-                                target_piece = board.get_piece(nr, nc)
-                                if (nr, nc) == square:
-                                    return True
-                                if target_piece != "--":
-                                    break
-                                nr += dr
-                                nc += dc
-                elif piece[1] == "K":
-                    for dr, dc in self.king_moves:
-                        if (r+dr, c+dc) == square:
-                            return True
-        return False
+        if board.backend == "bitboard":
+            return board.is_square_attacked(square, attacking_color)
+        return bool(self._find_attackers(board, square, attacking_color, True))
+    #Squares of every attacking_color piece that attacks square
+    def attackers_of(self, square, attacking_color) -> list:
+        if self.board.backend == "bitboard":
+            return self.board.attackers_of(square, attacking_color)
+        return self._find_attackers(self.board, square, attacking_color, False)
+    #Looks outward from the target square only, so the cost depends on the
+    #squares around it and not on where the attacking pieces are
+    def _find_attackers(self, board, square, attacking_color, first_only) -> list:
+        attackers = []
+        color = attacking_color[0]
+        r, c = square
+        #Attacking pawns sit one row behind the target from their side
+        pawn_row = r + 1 if color == "w" else r - 1
+        if 0 <= pawn_row < 8:
+            pawn = color + "P"
+            for nc in (c - 1, c + 1):
+                if 0 <= nc < 8 and board.get_piece(pawn_row, nc) == pawn:
+                    attackers.append((pawn_row, nc))
+                    if first_only:
+                        return attackers
+        knight = color + "N"
+        for dr, dc in self.knight_moves:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < 8 and 0 <= nc < 8 and board.get_piece(nr, nc) == knight:
+                attackers.append((nr, nc))
+                if first_only:
+                    return attackers
+        king = color + "K"
+        for dr, dc in self.king_moves:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < 8 and 0 <= nc < 8 and board.get_piece(nr, nc) == king:
+                attackers.append((nr, nc))
+                if first_only:
+                    return attackers
+        for dr, dc in self.queen_directions:
+            sliders = ("B", "Q") if dr != 0 and dc != 0 else ("R", "Q")
+            nr, nc = r + dr, c + dc
+            while 0 <= nr < 8 and 0 <= nc < 8:
+                piece = board.get_piece(nr, nc)
+                if piece != "--":
+                    #Only the first piece on the ray can attack along it
+                    if piece[0] == color and piece[1] in sliders:
+                        attackers.append((nr, nc))
+                        if first_only:
+                            return attackers
+                    break
+                nr += dr
+                nc += dc
+        return attackers
     def is_square_forking(self, board, move:Move) -> bool:
         if not self.is_square_attacked(board, move.end, "w" if move.moved_piece[0] == "b" else "b"):
             piece = move.moved_piece
-            temp_eval = Evaluator()
-            piece_val = temp_eval.piece_values
             if piece[1] == "P":
                 dir = [(-1, -1), (-1, 1)] if piece[0] == 'w' else [(1, -1), (1, 1)]
                 attacked_pieces = []
@@ -175,93 +192,220 @@ class Rules:
             return True
     #move generation - overall legalmoves
     def generate_legal_moves(self, color: str):
+        #BitBoard works out its own checks and pins while generating
+        if self.board.backend == "bitboard":
+            return self.board.generate_legal_moves(color)
         pseudo_legal_moves = self.generate_pseudo_legal_moves(color)
+        return self.filter_legal_moves(pseudo_legal_moves, color)
+    #Captures and promotions only, for quiescence search and the move picker.
+    #checks_and_pins from get_checks_and_pins can be shared between stages
+    def generate_legal_captures(self, color: str, checks_and_pins=None):
+        if self.board.backend == "bitboard":
+            return self.board.generate_legal_moves(color, captures_only=True)
+        pseudo_legal_moves = self.generate_pseudo_legal_moves(color, captures_only=True)
+        return self.filter_legal_moves(pseudo_legal_moves, color, checks_and_pins)
+    #Everything generate_legal_captures leaves out, castling included
+    def generate_legal_quiets(self, color: str, checks_and_pins=None):
+        if self.board.backend == "bitboard":
+            return self.board.generate_legal_moves(color, quiets_only=True)
+        pseudo_legal_moves = self.generate_pseudo_legal_moves(color, quiets_only=True)
+        return self.filter_legal_moves(pseudo_legal_moves, color, checks_and_pins)
+    #Whether a move from elsewhere (table move, killer) can be played here by
+    #color, ignoring checks. Only the moving piece's moves are generated
+    def is_pseudo_legal(self, move, color: str) -> bool:
+        r, c = move.start
+        piece = self.board.get_piece(r, c)
+        if piece[0] != color or piece != move.moved_piece:
+            return False
+        piece_type = piece[1]
+        if self.board.backend == "bitboard":
+            candidates = self.board.generate_pseudo_legal_moves(color, from_mask=1 << (r * 8 + c))
+        elif piece_type == "P":
+            candidates = self._generate_pawn_moves([(r, c)], color)
+        elif piece_type == "N":
+            candidates = self._generate_knight_moves(r, c, color)
+        elif piece_type == "B":
+            candidates = self._generate_sliding_moves(r, c, color, self.bishop_directions)
+        elif piece_type == "R":
+            candidates = self._generate_sliding_moves(r, c, color, self.rook_directions)
+        elif piece_type == "Q":
+            candidates = self._generate_sliding_moves(r, c, color, self.queen_directions)
+        else:
+            candidates = self._generate_king_moves(r, c, color)
+        for candidate in candidates:
+            if (candidate.end == move.end and candidate.promotion == move.promotion and
+                    candidate.piece_captured == move.piece_captured):
+                return True
+        return False
+    #Legal move matching UCI text such as e2e4 or e7e8q, None if there is none
+    def move_from_uci(self, text: str):
+        color = "w" if self.board.white_to_move else "b"
+        for move in self.generate_legal_moves(color):
+            if move.to_uci() == text:
+                return move
+        return None
+    #Checkers and absolute pins of color's king, found once per position by
+    #walking outward from the king
+    #returns (king_pos, checkers, pins, block_squares)
+    #pins: pinned square -> ray direction, block_squares: squares that stop a single check
+    def get_checks_and_pins(self, color: str) -> tuple:
+        if self.board.backend == "bitboard":
+            return self.board.get_checks_and_pins(color)
+        board = self.board
+        king_pos = board.find_king(color)
+        checkers = []
+        pins = {}
+        block_squares = set()
+        if not king_pos:
+            return king_pos, checkers, pins, block_squares
+        enemy = "b" if color == "w" else "w"
+        kr, kc = king_pos
+        for dr, dc in self.queen_directions:
+            sliders = ("B", "Q") if dr != 0 and dc != 0 else ("R", "Q")
+            ray = []
+            candidate = None
+            nr, nc = kr + dr, kc + dc
+            while 0 <= nr < 8 and 0 <= nc < 8:
+                piece = board.get_piece(nr, nc)
+                if piece != "--":
+                    if piece[0] == color:
+                        if candidate:
+                            break
+                        candidate = (nr, nc)
+                    else:
+                        if piece[1] in sliders:
+                            if candidate:
+                                pins[candidate] = (dr, dc)
+                            else:
+                                checkers.append((nr, nc))
+                                block_squares.update(ray)
+                                block_squares.add((nr, nc))
+                        break
+                elif not candidate:
+                    ray.append((nr, nc))
+                nr += dr
+                nc += dc
+        for dr, dc in self.knight_moves:
+            nr, nc = kr + dr, kc + dc
+            if 0 <= nr < 8 and 0 <= nc < 8 and board.get_piece(nr, nc) == enemy + "N":
+                checkers.append((nr, nc))
+                block_squares.add((nr, nc))
+        #Enemy pawns attack towards our side of the board
+        pawn_row = kr - 1 if color == "w" else kr + 1
+        if 0 <= pawn_row < 8:
+            for nc in (kc - 1, kc + 1):
+                if 0 <= nc < 8 and board.get_piece(pawn_row, nc) == enemy + "P":
+                    checkers.append((pawn_row, nc))
+                    block_squares.add((pawn_row, nc))
+        return king_pos, checkers, pins, block_squares
+    def filter_legal_moves(self, moves, color: str, checks_and_pins=None) -> list:
+        if checks_and_pins is None:
+            checks_and_pins = self.get_checks_and_pins(color)
+        king_pos, checkers, pins, block_squares = checks_and_pins
+        board = self.board
+        en_passant = board.en_passant_square
+        double_check = len(checkers) > 1
         legal_moves = []
-        
-        for move in pseudo_legal_moves:
-            self.board.make_move(move)
+        for move in moves:
+            piece = move.moved_piece
+            #King steps and en passant change attacks in ways pins do not
+            #cover, so they are still tried on the board
+            if piece[1] == "K":
+                if move.is_castling(piece):
+                    #can_castle already made sure no square is attacked
+                    legal_moves.append(move)
+                    continue
+            elif not (piece[1] == "P" and move.end == en_passant and en_passant is not None):
+                if double_check:
+                    continue
+                if checkers and move.end not in block_squares:
+                    continue
+                pin = pins.get(move.start)
+                if pin:
+                    #A pinned piece may only slide along the pin line
+                    if (move.end[0] - king_pos[0]) * pin[1] != (move.end[1] - king_pos[1]) * pin[0]:
+                        continue
+                legal_moves.append(move)
+                continue
+            board.make_move(move)
             if not self.in_check(color):
                 legal_moves.append(move)
-            self.board.undo_move()
+            board.undo_move()
         return legal_moves
     #move generation - overall moves
-    def generate_pseudo_legal_moves(self, color: str):
-        moves = []
-        for r in range(8):
-            for c in range(8):
-                piece = self.board.get_piece(r, c)
-                if piece[0] != color[0]:
-                    continue
-                piece_type = piece[1]
-                
-                if piece_type == "P":
-                    moves.extend(self._generate_pawn_moves(r, c, color))
-                elif piece_type == "N":
-                    moves.extend(self._generate_knight_moves(r, c, color))
-                elif piece_type == "B":
-                    moves.extend(self._generate_sliding_moves(r, c, color, self.bishop_directions))
-                elif piece_type == "R":
-                    moves.extend(self._generate_sliding_moves(r, c, color, self.rook_directions))
-                elif piece_type == "Q":
-                    moves.extend(self._generate_sliding_moves(r, c, color, self.queen_directions))
-                elif piece_type == "K":
-                    moves.extend(self._generate_king_moves(r, c, color))
+    #captures_only leaves out quiet moves, promotions are always included.
+    #quiets_only is the opposite: no captures or promotions
+    def generate_pseudo_legal_moves(self, color: str, captures_only=False, quiets_only=False):
+        if self.board.backend == "bitboard":
+            return self.board.generate_pseudo_legal_moves(color, captures_only, quiets_only)
+        piece_squares = self.board.piece_squares
+        #Only the squares our pieces are on, straight from the piece lists.
+        #Moves come out in BitBoard's order (squares and targets ascending,
+        #castling last) so both backends search the same tree
+        moves = self._generate_pawn_moves(sorted(piece_squares[color + "P"]), color, captures_only, quiets_only)
+        for r, c in sorted(piece_squares[color + "N"]):
+            moves.extend(self._generate_knight_moves(r, c, color, captures_only, quiets_only))
+        for piece_type, directions in (("B", self.bishop_directions), ("R", self.rook_directions), ("Q", self.queen_directions)):
+            for r, c in sorted(piece_squares[color + piece_type]):
+                moves.extend(sorted(self._generate_sliding_moves(r, c, color, directions, captures_only, quiets_only), key=MOVE_END))
+        for r, c in piece_squares[color + "K"]:
+            moves.extend(self._generate_king_moves(r, c, color, captures_only, quiets_only))
         return moves
     #move generation - piece specific
-    def _generate_pawn_moves(self, r, c, color) -> list:
-        moves = []
-        piece = self.board.get_piece(r, c)
+    #Pawns on squares, grouped like BitBoard: pushes, captures to the left,
+    #captures to the right, double pushes, en passant
+    def _generate_pawn_moves(self, squares, color, captures_only=False, quiets_only=False) -> list:
+        pushes, lefts, rights, doubles, en_passants = [], [], [], [], []
+        board = self.board.board
+        piece = color + "P"
+        enemy = "b" if color == "w" else "w"
         dir = -1 if color == "w" else 1
         start_row = 6 if color == "w" else 1
         prom_row = 0 if color == "w" else 7
+        en_passant = self.board.en_passant_square
         
-        new_r = r + dir
-        #generate normal advancement
-        if 0 <= new_r < 8:
-            if self.board.get_piece(new_r, c) == "--":
+        for r, c in squares:
+            new_r = r + dir
+            if not 0 <= new_r < 8:
+                continue
+            #generate normal advancement
+            if board[new_r][c] == "--":
                 if new_r == prom_row:
-                    for prom_piece in ["Q", "R", "N", "B"]:
-                        moves.append(Move((r,c), (new_r,c), piece, promotion=prom_piece))
-                else:
-                    moves.append(Move((r,c), (new_r, c), piece))
-                #generate starting double move
-                if r == start_row and self.board.get_piece(new_r + dir, c) == "--":
-                    moves.append(Move((r,c), (new_r + dir, c), piece))
-            #generate capture to the left
-            if c - 1 >= 0:
-                target_piece = self.board.get_piece(new_r, c-1)
-                if target_piece[0] != color[0] and target_piece[0] != "-":
-                    if new_r == prom_row:
-                        for prom_piece in ["Q", "R", "N", "B"]:
-                            moves.append(Move((r,c), (new_r,c-1), piece, piece_captured=target_piece, promotion=prom_piece))
-                    else:
-                        moves.append(Move((r,c), (new_r, c-1), piece, piece_captured=target_piece))
-            #generate capture to the right
-            if c + 1 < 8:
-                target_piece = self.board.get_piece(new_r, c+1)
-                if target_piece[0] != color[0] and target_piece[0] != "-":
-                    if new_r == prom_row:
+                    if not quiets_only:
                         for prom_piece in ["Q", "R", "N", "B"]:
-                            moves.append(Move((r,c), (new_r,c+1), piece, piece_captured=target_piece, promotion=prom_piece))
-                    else:
-                        moves.append(Move((r,c), (new_r, c+1), piece, piece_captured=target_piece))
-            #generate en passant
-            for dc in [-1, 1]:
-                if self.board.en_passant_square == (new_r, c + dc):
-                    captured_pawn = "bP" if color == "w" else "wP"
-                    moves.append(Move((r,c), (new_r, c + dc), piece, piece_captured=captured_pawn))
-        return moves
-    def _generate_knight_moves(self, r, c, color) -> list:
+                            pushes.append(Move((r,c), (new_r,c), piece, promotion=prom_piece))
+                elif not captures_only:
+                    pushes.append(Move((r,c), (new_r, c), piece))
+                #generate starting double move
+                if not captures_only and r == start_row and board[new_r + dir][c] == "--":
+                    doubles.append(Move((r,c), (new_r + dir, c), piece))
+            if quiets_only:
+                continue
+            #generate captures to the left and right
+            for new_c, captures in ((c - 1, lefts), (c + 1, rights)):
+                if 0 <= new_c < 8:
+                    target_piece = board[new_r][new_c]
+                    if target_piece[0] == enemy:
+                        if new_r == prom_row:
+                            for prom_piece in ["Q", "R", "N", "B"]:
+                                captures.append(Move((r,c), (new_r,new_c), piece, piece_captured=target_piece, promotion=prom_piece))
+                        else:
+                            captures.append(Move((r,c), (new_r, new_c), piece, piece_captured=target_piece))
+                    #generate en passant
+                    elif en_passant == (new_r, new_c):
+                        en_passants.append(Move((r,c), (new_r, new_c), piece, piece_captured=enemy + "P"))
+        return pushes + lefts + rights + doubles + en_passants
+    def _generate_knight_moves(self, r, c, color, captures_only=False, quiets_only=False) -> list:
         moves = []
         piece = self.board.get_piece(r, c)
         for dr, dc in self.knight_moves:
             new_r, new_c = r + dr, c + dc
             if 0 <= new_r < 8 and 0 <= new_c < 8:
                 target_piece = self.board.get_piece(new_r, new_c)
-                if target_piece[0] != color[0]:
+                if target_piece[0] != color[0] and not (captures_only and target_piece == "--") and not (quiets_only and target_piece != "--"):
                     moves.append(Move((r,c), (new_r, new_c), piece, piece_captured=target_piece))
         return moves
-    def _generate_sliding_moves(self, r, c, color, dir) -> list:
+    def _generate_sliding_moves(self, r, c, color, dir, captures_only=False, quiets_only=False) -> list:
         moves = []
         piece = self.board.get_piece(r,c)
         for dr, dc in dir:
@@ -269,24 +413,25 @@ class Rules:
             while 0 <= new_r < 8 and 0 <= new_c < 8:
                 target_piece = self.board.get_piece(new_r, new_c)
                 if target_piece == "--":
-                    moves.append(Move((r,c), (new_r, new_c), piece))
+                    if not captures_only:
+                        moves.append(Move((r,c), (new_r, new_c), piece))
                 else:
-                    if target_piece[0] != color[0]:
+                    if target_piece[0] != color[0] and not quiets_only:
                         moves.append(Move((r,c), (new_r, new_c), piece, piece_captured=target_piece))
                     break
                 new_r += dr
                 new_c += dc
         return moves
-    def _generate_king_moves(self, r, c, color) -> list:
+    def _generate_king_moves(self, r, c, color, captures_only=False, quiets_only=False) -> list:
         moves = []
         piece = self.board.get_piece(r, c)
         for dr, dc in self.king_moves:
             new_r, new_c = r + dr, c + dc
             if 0 <= new_r < 8 and 0 <= new_c < 8:
                 target_piece = self.board.get_piece(new_r, new_c)
-                if target_piece[0] != color[0]:
+                if target_piece[0] != color[0] and not (captures_only and target_piece == "--") and not (quiets_only and target_piece != "--"):
                     moves.append(Move((r,c), (new_r, new_c), piece, piece_captured=target_piece))
-        if not self.in_check(color):
+        if not captures_only and not self.in_check(color):
             if self.can_castle(color, "K"):
                 king_end_col = 6
                 moves.append(Move((r,c), (r, king_end_col), piece))
@@ -1,15 +1,136 @@
-from engine.rules import Rules
+import threading
+import time
 from engine.move import Move
 from engine.eval import Evaluator
 
+MATE_SCORE = 20000
+#Scores beyond this are mates, stored in the table relative to the node
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+MAX_DEPTH = 64
+#Most pieces (kings included) a tablebase position can have
+TABLEBASE_PIECES = 3
+#How often (in nodes) the clock and the stop flag are looked at
+CHECK_INTERVAL = 1024
+
+#Null move: searched this much shallower, and only with enough depth left
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+#Late move reductions: after this many moves quiets go one ply shallower,
+#two after LMR_LATE_MOVES when there is depth to spare
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3
+LMR_LATE_MOVES = 10
+
+#Iterations from this depth on start with a window this wide around the
+#previous score, a side that fails is opened fully and searched again
+ASPIRATION_MIN_DEPTH = 3
+ASPIRATION_WINDOW = 50
+
+#Captures that cannot lift the score this close to alpha are skipped in quiescence
+DELTA_MARGIN = 200
+
+#Move ordering: table move, captures, promotions, killers, then history
+TT_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 90000
+KILLER_SCORES = (80000, 79000)
+#History scores are halved once any of them passes this, staying below killers
+HISTORY_LIMIT = 50000
+
+#Most valuable victim first, least valuable attacker breaks ties
+PIECE_ORDER = "PNBRQK"
+MVV_LVA = {
+    (victim, attacker): (PIECE_ORDER.index(victim) + 1) * 10 + 5 - PIECE_ORDER.index(attacker)
+    for victim in PIECE_ORDER for attacker in PIECE_ORDER
+}
+PROMOTION_ORDER = {"Q": 4, "R": 3, "B": 2, "N": 1}
+
+#Transposition table bound types
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class TranspositionTable:
+    def __init__(self, size=1 << 18):
+        #Round down to a power of two so the slot is just key & mask
+        self.size = 1 << (max(size, 1).bit_length() - 1)
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0
+    def new_search(self):
+        #Entries from earlier searches are replaced even by shallower ones
+        self.generation += 1
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+    #entry: (key, depth, score, flag, best_move, generation)
+    #best_move is the packed int from Move.encode()
+    def store(self, key, depth, score, flag, best_move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if (entry is None or entry[0] == key or depth >= entry[1]
+                or entry[5] != self.generation):
+            #Keep the old best move when this search did not produce one
+            if best_move is None and entry is not None and entry[0] == key:
+                best_move = entry[4]
+            self.entries[index] = (key, depth, score, flag, best_move, self.generation)
+
+#Raised inside alpha_beta to unwind the tree when a limit is hit
+class SearchStopped(Exception):
+    pass
+
 class Search:
-    def __init__(self, board, rules, evaluator=None):
+    def __init__(self, board, rules, evaluator=None, tt=None, tablebase=None):
         self.board = board
         self.rules = rules
         self.nodes_searched = 0
+        self.qnodes = 0
         self.positions_evalled = 0
+        self.tt_hits = 0
+
+        #Set from any thread to make the running search return early
+        self.stop_event = threading.Event()
+        self.start_time = 0
+        #time_limit counts from here, moved to the ponderhit when pondering
+        self.clock_start = 0
+        self.time_limit = None
+        self.node_limit = None
+        self.pondering = False
+        self.ponder_time_limit = None
+        self.completed_depth = 0
+        self.best_score = None
+        self.pv = []
+        #Total nodes (main + quiescence) when each depth finished
+        self.depth_nodes = []
+        #Prints a summary after every search
+        self.verbose = True
+        #Called with the search after every finished depth, e.g. for UCI info lines
+        self.on_iteration = None
+        #Pruning switches, turn off to compare against plain alpha-beta
+        self.use_null_move = True
+        self.use_lmr = True
+
+        #Triangular PV table: row ply holds the best line from that ply, filled
+        #from pv_table[ply] to pv_length[ply] as better moves are found
+        self.pv_table = [[None] * (MAX_DEPTH + 2) for _ in range(MAX_DEPTH + 2)]
+        self.pv_length = [0] * (MAX_DEPTH + 2)
+
+        #Two quiet moves per ply (packed ints) that caused a beta cutoff
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        #Butterfly table: color, from square, to square -> cutoff score
+        self.history = {"w": [0] * 4096, "b": [0] * 4096}
 
         self.evaluator = evaluator if evaluator else Evaluator()
+        self.tt = tt if tt else TranspositionTable()
+        #Endgame tables, positions they cover are scored exactly without searching
+        self.tablebase = tablebase
+        self.tb_hits = 0
 
         self.piece_values = {
             "P": 1,
@@ -19,9 +140,33 @@ class Search:
             "Q": 9,
             "K": 20000
         }
-    def find_best_move(self, depth):
+    #Iterative deepening, returns the best move of the last finished depth.
+    #Times are in milliseconds, with no limit at all it runs until stop().
+    #ponder: searching on the opponent's time, the clock only starts at ponderhit()
+    def find_best_move(self, depth=None, movetime=None, wtime=None, btime=None, winc=0, binc=0, nodes=None, ponder=False):
+        #A stop() that came in while nothing was running is not meant for this search
+        self.stop_event.clear()
         self.nodes_searched = 0
+        self.qnodes = 0
         self.positions_evalled = 0
+        self.tt_hits = 0
+        self.tb_hits = 0
+        self.completed_depth = 0
+        self.best_score = None
+        self.pv = []
+        self.depth_nodes = []
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.age_history()
+        self.start_time = time.monotonic()
+        self.clock_start = self.start_time
+        self.time_limit = self.allocate_time(movetime, wtime, btime, winc, binc)
+        self.pondering = ponder
+        if ponder:
+            self.ponder_time_limit = self.time_limit
+            self.time_limit = None
+        self.node_limit = nodes
+        max_depth = depth if depth is not None else MAX_DEPTH
         
         color = "w" if self.board.white_to_move else "b"
         legal_moves = self.rules.generate_legal_moves(color)
@@ -29,85 +174,420 @@ class Search:
         if not legal_moves:
             return None
         
-        best_move = None
-        best_score = float('-inf')
+        entry = self.tt.probe(self.board.zobrist_key)
+        tt_move = entry[4] if entry else None
+        root_moves = self.order_moves(legal_moves, tt_move)
+        root_stack = len(self.board.move_stack)
+        
+        #Something to play even if the first iteration is cut short
+        best_move = root_moves[0]
+        best_score = None
+        try:
+            for current_depth in range(1, max_depth + 1):
+                try:
+                    move, score = self.search_aspiration(current_depth, root_moves, best_score)
+                except SearchStopped:
+                    #Take back the moves the aborted iteration left on the board
+                    while len(self.board.move_stack) > root_stack:
+                        self.board.undo_move()
+                    break
+                best_move, best_score = move, score
+                self.completed_depth = current_depth
+                self.depth_nodes.append(self.nodes_searched + self.qnodes)
+                self.pv = self.collect_pv(current_depth)
+                self.best_score = score
+                if self.on_iteration is not None:
+                    self.on_iteration(self)
+                #The next iteration starts with this one's best move
+                root_moves.remove(move)
+                root_moves.insert(0, move)
+                #Another iteration takes several times longer than this one
+                if self.time_limit is not None and self.clock_ms() * 2 > self.time_limit:
+                    break
+        finally:
+            self.stop_event.clear()
+        self.best_score = best_score
+        if self.verbose:
+            print(f"Searched {self.nodes_searched} nodes (+{self.qnodes} quiescence) to depth {self.completed_depth}, evaluated {self.positions_evalled} positions, {self.tt_hits} table hits")
+            print(f"Best move: {best_move} with score: {best_score}")
+        
+        return best_move
+    #Searches a narrow window around the last iteration's score first, a
+    #score outside it only bounds the real one so that side is reopened
+    def search_aspiration(self, depth, root_moves, previous_score):
         a = float('-inf')
         b = float('inf')
-        for move in self.order_moves(legal_moves):
+        if (depth >= ASPIRATION_MIN_DEPTH and previous_score is not None and
+                abs(previous_score) < MATE_THRESHOLD):
+            a = previous_score - ASPIRATION_WINDOW
+            b = previous_score + ASPIRATION_WINDOW
+        while True:
+            move, score = self.search_root(depth, root_moves, a, b)
+            if score <= a:
+                a = float('-inf')
+            elif score >= b:
+                b = float('inf')
+            else:
+                return move, score
+    #PVS at the root: the first move gets the full window, the rest a null
+    #window that only has to show they are no better
+    def search_root(self, depth, root_moves, a=float('-inf'), b=float('inf')):
+        alpha_orig = a
+        best_move = None
+        best_score = float('-inf')
+        self.pv_length[0] = 0
+        for move in root_moves:
             self.board.make_move(move)
-            score = -self.alpha_beta(depth-1, a, b, False)
+            if best_move is None:
+                score = -self.alpha_beta(depth-1, -b, -a, 1)
+            else:
+                score = -self.alpha_beta(depth-1, -a - 1, -a, 1)
+                if a < score < b:
+                    score = -self.alpha_beta(depth-1, -b, -a, 1)
             self.board.undo_move()
             
             if score > best_score:
                 best_score = score
                 best_move = move
-            a = max(a, score)
-        print(f"Searched {self.nodes_searched} nodes, evaluated {self.positions_evalled} positions")
-        print(f"Best move: {best_move} with score: {best_score}")
-        
-        return best_move
-    def alpha_beta(self, depth, a, b, maximizing):
+            if score > a:
+                a = score
+                self.update_pv(0, move)
+            if a >= b:
+                break
+        if best_score <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best_score >= b:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.tt.store(self.board.zobrist_key, depth, best_score, flag, best_move.encode())
+        return best_move, best_score
+    def stop(self):
+        self.stop_event.set()
+    #The predicted move was played: keep searching, now on our own clock
+    def ponderhit(self):
+        if not self.pondering:
+            return
+        #start_time stays put so reported time and nps cover the whole search
+        self.clock_start = time.monotonic()
+        self.time_limit = self.ponder_time_limit
+        self.pondering = False
+    def elapsed_ms(self):
+        return (time.monotonic() - self.start_time) * 1000
+    #Time used against time_limit
+    def clock_ms(self):
+        return (time.monotonic() - self.clock_start) * 1000
+    #Milliseconds to spend on this move, None for no time limit
+    def allocate_time(self, movetime, wtime, btime, winc, binc):
+        if movetime is not None:
+            return movetime
+        time_left = wtime if self.board.white_to_move else btime
+        if time_left is None:
+            return None
+        increment = (winc if self.board.white_to_move else binc) or 0
+        #Plan for about 30 more moves but never use more than half the clock
+        return max(1, min(time_left / 30 + increment / 2, time_left / 2))
+    def check_limits(self):
+        if self.stop_event.is_set():
+            raise SearchStopped()
+        if self.node_limit is not None and self.nodes_searched + self.qnodes >= self.node_limit:
+            raise SearchStopped()
+        if self.time_limit is not None and self.clock_ms() >= self.time_limit:
+            raise SearchStopped()
+    #Move at ply followed by the best line found below it
+    def update_pv(self, ply, move):
+        row = self.pv_table[ply]
+        child = self.pv_table[ply + 1]
+        row[ply] = move
+        child_length = self.pv_length[ply + 1]
+        for i in range(ply + 1, child_length):
+            row[i] = child[i]
+        self.pv_length[ply] = max(child_length, ply + 1)
+    #The root line from the PV table. Table cutoffs end lines early, so it
+    #is continued from the transposition table where possible
+    def collect_pv(self, depth):
+        pv = self.pv_table[0][:self.pv_length[0]]
+        for move in pv:
+            self.board.make_move(move)
+        pv += self.get_pv(depth - len(pv))
+        for _ in range(self.pv_length[0]):
+            self.board.undo_move()
+        return pv
+    #Expected line of play, following best moves stored in the table
+    def get_pv(self, depth):
+        pv = []
+        seen = set()
+        for _ in range(depth):
+            key = self.board.zobrist_key
+            entry = self.tt.probe(key)
+            if entry is None or entry[4] is None or key in seen:
+                break
+            seen.add(key)
+            move = Move.decode(entry[4], self.board)
+            pv.append(move)
+            self.board.make_move(move)
+        for _ in pv:
+            self.board.undo_move()
+        return pv
+    #Negamax: scores are always from the side to move's point of view
+    #allow_null: off right after a null move, two passes in a row prove nothing
+    def alpha_beta(self, depth, a, b, ply, allow_null=True):
+        self.pv_length[ply] = ply
+        #A repeat of an earlier position is scored as a draw, it can be
+        #played again and again (also cuts off cycles in the tree)
+        if self.board.is_repetition():
+            return 0
+        if self.tablebase is not None and self.board.piece_count <= TABLEBASE_PIECES:
+            tb_score = self.tablebase.probe_score(self.board, ply)
+            if tb_score is not None:
+                self.tb_hits += 1
+                return tb_score
+        if depth <= 0:
+            return self.quiescence(a, b, ply)
         self.nodes_searched += 1
+        if self.nodes_searched % CHECK_INTERVAL == 0:
+            self.check_limits()
+        
+        key = self.board.zobrist_key
+        alpha_orig = a
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                tt_score = self.score_from_tt(entry[2], ply)
+                flag = entry[3]
+                if (flag == EXACT or
+                        (flag == LOWER_BOUND and tt_score >= b) or
+                        (flag == UPPER_BOUND and tt_score <= a)):
+                    self.tt_hits += 1
+                    return tt_score
         
-        if depth == 0:
-            self.positions_evalled += 1
-            return self.evaluator.evaluate(self.board)
         color = "w" if self.board.white_to_move else "b"
-        legal_moves = self.rules.generate_legal_moves(color)
+        enemy = "b" if color == "w" else "w"
+        in_check = self.rules.in_check(color)
+        #Null move: if passing the turn still fails high, some real move will
+        #too. Not in check (passing would be illegal) and not with only king
+        #and pawns, where zugzwang makes passing better than any move
+        if (self.use_null_move and allow_null and depth >= NULL_MOVE_MIN_DEPTH and
+                not in_check and b < MATE_THRESHOLD and self.has_pieces(color)):
+            self.board.make_null_move()
+            score = -self.alpha_beta(depth - 1 - NULL_MOVE_REDUCTION, -b, -b + 1, ply + 1, False)
+            self.board.undo_null_move()
+            if score >= b:
+                return b
         
-        if not legal_moves:
-            if self.rules.in_check(color):
-                return -20000 + depth
+        killers = self.killers[ply]
+        best_score = float('-inf')
+        best_move = None
+        moves_searched = 0
+        for move in self.pick_moves(color, tt_move, ply):
+            self.board.make_move(move)
+            #Late quiet moves rarely matter: a shallower null-window search
+            #first, the full one only if the move beats alpha after all
+            if (self.use_lmr and depth >= LMR_MIN_DEPTH and moves_searched >= LMR_FULL_MOVES and
+                    not in_check and a > -MATE_THRESHOLD and move.piece_captured == "--" and
+                    not move.promotion and move.encode() not in killers and
+                    not self.rules.in_check(enemy)):
+                reduction = 2 if moves_searched >= LMR_LATE_MOVES and depth >= 5 else 1
+                score = -self.alpha_beta(depth - 1 - reduction, -a - 1, -a, ply + 1)
+                if score > a:
+                    score = -self.alpha_beta(depth - 1, -a - 1, -a, ply + 1)
+            elif moves_searched == 0:
+                score = -self.alpha_beta(depth - 1, -b, -a, ply + 1)
             else:
-                return 0
+                #PVS: after the first move only a null window, unless it
+                #turns out better and the real score is needed
+                score = -self.alpha_beta(depth - 1, -a - 1, -a, ply + 1)
+            if moves_searched and a < score < b:
+                score = -self.alpha_beta(depth - 1, -b, -a, ply + 1)
+            self.board.undo_move()
+            moves_searched += 1
             
-        if maximizing:
-            max_score = float('-inf')
-            for move in self.order_moves(legal_moves):
-                self.board.make_move(move)
-                score = self.alpha_beta(depth - 1, b, a, False)
-                
-                self.board.undo_move()
-                
-                max_score = max(max_score, score)
-                a = max(a, score)
-                if b <= a:
-                    break
-            return max_score
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > a:
+                a = score
+                self.update_pv(ply, move)
+            if a >= b:
+                if not move.is_capture() and not move.is_promotion():
+                    self.update_quiet_cutoff(move, color, depth, ply)
+                break
+        
+        if best_move is None:
+            #The picker had nothing at all: mate or stalemate
+            if in_check:
+                return -MATE_SCORE + ply
+            return 0
+        
+        if best_score <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best_score >= b:
+            flag = LOWER_BOUND
         else:
-            min_score = float('inf')
-            for move in self.order_moves(legal_moves):
-                self.board.make_move(move)
-                score = self.alpha_beta(depth - 1, a, b, True)
-                
-                self.board.undo_move()
-                
-                min_score = min(min_score, score)
-                b = min(b, score)
-                if b <= a:
-                    break
-            return min_score
-    def order_moves(self, moves):
+            flag = EXACT
+        self.tt.store(key, depth, self.score_to_tt(best_score, ply), flag,
+                      best_move.encode() if best_move else None)
+        return best_score
+    #Anything besides king and pawns, null-move pruning is unsafe without
+    def has_pieces(self, color) -> bool:
+        if self.board.backend == "bitboard":
+            bitboards = self.board.bitboards
+            return bool(bitboards[color + "N"] | bitboards[color + "B"] |
+                        bitboards[color + "R"] | bitboards[color + "Q"])
+        piece_squares = self.board.piece_squares
+        return bool(piece_squares[color + "N"] or piece_squares[color + "B"] or
+                    piece_squares[color + "R"] or piece_squares[color + "Q"])
+    #Resolves captures and promotions past the horizon so the static eval
+    #is only taken in quiet positions
+    def quiescence(self, a, b, ply):
+        self.qnodes += 1
+        if self.qnodes % CHECK_INTERVAL == 0:
+            self.check_limits()
+        
+        color = "w" if self.board.white_to_move else "b"
+        in_check = self.rules.in_check(color)
+        if in_check:
+            #No standing pat in check, every evasion is searched
+            legal_moves = self.rules.generate_legal_moves(color)
+            if not legal_moves:
+                return -MATE_SCORE + ply
+            best_score = float('-inf')
+            stand_pat = None
+        else:
+            self.positions_evalled += 1
+            stand_pat = self.evaluator.evaluate(self.board)
+            if not self.board.white_to_move:
+                stand_pat = -stand_pat
+            if stand_pat >= b or ply >= MAX_DEPTH:
+                return stand_pat
+            a = max(a, stand_pat)
+            best_score = stand_pat
+            legal_moves = self.rules.generate_legal_captures(color)
+        
+        piece_values = self.evaluator.piece_values
+        for move in self.order_moves(legal_moves):
+            if stand_pat is not None:
+                #Delta pruning: even winning this piece for free is not enough
+                gain = piece_values[move.piece_captured[1]] if move.piece_captured != "--" else 0
+                if move.promotion:
+                    gain += piece_values[move.promotion] - piece_values["P"]
+                if stand_pat + gain + DELTA_MARGIN <= a:
+                    continue
+            self.board.make_move(move)
+            score = -self.quiescence(-b, -a, ply + 1)
+            self.board.undo_move()
+            
+            if score > best_score:
+                best_score = score
+            a = max(a, score)
+            if a >= b:
+                break
+        return best_score
+    #Mate scores count from the root, the table needs them from the node
+    def score_to_tt(self, score, ply):
+        if score > MATE_THRESHOLD:
+            return score + ply
+        if score < -MATE_THRESHOLD:
+            return score - ply
+        return score
+    def score_from_tt(self, score, ply):
+        if score > MATE_THRESHOLD:
+            return score - ply
+        if score < -MATE_THRESHOLD:
+            return score + ply
+        return score
+    def update_quiet_cutoff(self, move, color, depth, ply):
+        key = move.encode()
+        killers = self.killers[ply]
+        if killers[0] != key:
+            killers[1] = killers[0]
+            killers[0] = key
+        history = self.history[color]
+        index = (move.start[0] * 8 + move.start[1]) * 64 + move.end[0] * 8 + move.end[1]
+        history[index] += depth * depth
+        if history[index] > HISTORY_LIMIT:
+            self.age_history()
+    #Older cutoffs count for less, keeps the table from saturating
+    def age_history(self):
+        for table in self.history.values():
+            for i in range(4096):
+                table[i] >>= 1
+    #Staged move picker for alpha_beta: table move, winning captures, killers,
+    #quiets by history, then losing captures. A stage is only generated once
+    #the ones before it are used up, most nodes cut off before the quiets
+    def pick_moves(self, color, tt_move, ply):
+        rules = self.rules
+        checks_and_pins = rules.get_checks_and_pins(color)
+        #Packed moves already handed out, later stages skip them
+        played = set()
+        if tt_move is not None:
+            move = self.validate_move(tt_move, color, checks_and_pins)
+            if move is not None:
+                played.add(tt_move)
+                yield move
+
+        good_captures = []
+        bad_captures = []
+        enemy = "b" if color == "w" else "w"
+        for move in rules.generate_legal_captures(color, checks_and_pins):
+            if move.encode() in played:
+                continue
+            #Taking a defended piece with a more valuable one probably loses material
+            if (move.piece_captured != "--" and not move.promotion and
+                    self.piece_values[move.moved_piece[1]] > self.piece_values[move.piece_captured[1]] and
+                    rules.is_square_attacked(self.board, move.end, enemy)):
+                bad_captures.append(move)
+            else:
+                good_captures.append(move)
+        for move in self.order_moves(good_captures):
+            yield move
+
+        for killer in self.killers[ply]:
+            if killer is None or killer in played:
+                continue
+            move = self.validate_move(killer, color, checks_and_pins)
+            #A killer that captures here was already among the captures
+            if move is not None and move.piece_captured == "--" and not move.promotion:
+                played.add(killer)
+                yield move
+
+        quiets = [move for move in rules.generate_legal_quiets(color, checks_and_pins)
+                  if move.encode() not in played]
+        for move in self.order_moves(quiets):
+            yield move
+
+        for move in self.order_moves(bad_captures):
+            yield move
+    #The packed move as a legal Move in this position, None if it isn't one.
+    #Killers come from sibling positions, so they have to be checked
+    def validate_move(self, code, color, checks_and_pins):
+        move = Move.decode(code, self.board)
+        if not self.rules.is_pseudo_legal(move, color):
+            return None
+        if not self.rules.filter_legal_moves([move], color, checks_and_pins):
+            return None
+        return move
+    #tt_move is a packed move from the transposition table
+    def order_moves(self, moves, tt_move=None, ply=None):
+        killers = self.killers[ply] if ply is not None else (None, None)
+        history = self.history["w" if self.board.white_to_move else "b"]
         def move_priority(move):
-            r = Rules(self.board)
+            key = move.encode()
+            if key == tt_move:
+                return TT_MOVE_SCORE
             score = 0
-
-            # Additional priority for forks and pins
-            if r.is_square_forking(self.board, move):
-                score += 3000
-                counter += 1
-            if r.is_square_pinning(self.board, move):
-                score += 3000
-                counter += 1
-            if move.is_capture():
-                
-                target_value = self.evaluator.piece_values.get(move.piece_captured[1], 0)
-                attacker_value = self.evaluator.piece_values.get(move.moved_piece[1], 0)
-                score += 10000 + target_value - attacker_value
-            if move.is_promotion():
-                promotion_value = self.evaluator.piece_values.get(move.promotion, 0)
-                score += 5000 + promotion_value
-
-            return score
+            if move.piece_captured != "--":
+                score += CAPTURE_SCORE + MVV_LVA[(move.piece_captured[1], move.moved_piece[1])]
+            if move.promotion:
+                score += PROMOTION_SCORE + PROMOTION_ORDER[move.promotion]
+            if score:
+                return score
+            if key == killers[0]:
+                return KILLER_SCORES[0]
+            if key == killers[1]:
+                return KILLER_SCORES[1]
+            start, end = move.start, move.end
+            return history[(start[0] * 8 + start[1]) * 64 + end[0] * 8 + end[1]]
         return sorted(moves, key=move_priority, reverse=True)
-    
\ No newline at end of file
@@ -0,0 +1,291 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+from array import array
+from engine.board import Board
+from engine.rules import Rules
+from engine.search import MATE_SCORE, TABLEBASE_PIECES
+
+#Endgames with a lone king against king + one piece. Tables are built
+#with the strong side as white, black-strong positions are mirrored
+TABLE_PIECES = ("Q", "R", "P")
+#Promotions lead into these tables, so they are generated first
+PROMOTION_TABLES = ("Q", "R")
+
+#One byte per position: 0 draw (or illegal), 1-127 side to move mates in
+#that many plies, 128 + n side to move is mated in n plies
+DRAW = 0
+LOSS_BASE = 128
+MAX_DTM = 127
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+def table_name(piece) -> str:
+    return f"K{piece}K"
+
+#stm: 0 strong side (white) to move, squares are row * 8 + col
+def table_index(stm, strong_king, strong_piece, weak_king) -> int:
+    return ((stm * 64 + strong_king) * 64 + strong_piece) * 64 + weak_king
+
+#(result, dtm) for the side to move: result 1 win, -1 loss, 0 draw
+def decode_value(value) -> tuple:
+    if value == DRAW:
+        return 0, 0
+    if value < LOSS_BASE:
+        return 1, value
+    return -1, value - LOSS_BASE
+
+def kings_touch(a, b) -> bool:
+    return abs((a >> 3) - (b >> 3)) <= 1 and abs((a & 7) - (b & 7)) <= 1
+
+#Retrograde analysis of K + piece vs K. Every legal position's moves are
+#generated once with Rules, then results spread backwards from the mates
+#one ply at a time so each position gets its shortest distance to mate.
+#promotions: piece -> finished table bytes, for pawn promotions
+def generate_table(piece, promotions=None) -> bytearray:
+    promotions = promotions or {}
+    strong = "w" + piece
+    board = Board("8/8/8/8/8/8/8/8 w - - 0 1")
+    rules = Rules(board)
+
+    #Successors of every position in one flat array: an index into this
+    #table, or -1 - value for a result known from elsewhere (capture,
+    #promotion). Positions with no entry are illegal.
+    successors = array("i")
+    offsets = array("i", [0]) * (TABLE_SIZE + 1)
+    mated = bytearray(TABLE_SIZE)
+    legal = bytearray(TABLE_SIZE)
+    for index in range(TABLE_SIZE):
+        offsets[index] = len(successors)
+        weak_king = index & 63
+        strong_piece = (index >> 6) & 63
+        strong_king = (index >> 12) & 63
+        stm = index >> 18
+        if (strong_king == strong_piece or weak_king == strong_piece or
+                weak_king == strong_king or kings_touch(strong_king, weak_king)):
+            continue
+        if piece == "P" and (strong_piece >> 3) in (0, 7):
+            continue
+        board.set_piece(strong_king >> 3, strong_king & 7, "wK")
+        board.set_piece(strong_piece >> 3, strong_piece & 7, strong)
+        board.set_piece(weak_king >> 3, weak_king & 7, "bK")
+        board.white_to_move = stm == 0
+        color = "w" if stm == 0 else "b"
+        #The side that just moved cannot be left in check
+        if stm == 1 or not rules.is_square_attacked(board, (weak_king >> 3, weak_king & 7), "w"):
+            legal[index] = 1
+            moves = rules.generate_legal_moves(color)
+            if not moves and rules.in_check(color):
+                mated[index] = 1
+            for move in moves:
+                end = move.end[0] * 8 + move.end[1]
+                if move.moved_piece == "wK":
+                    successors.append(table_index(1, end, strong_piece, weak_king))
+                elif move.moved_piece == "bK":
+                    if move.piece_captured != "--":
+                        successors.append(-1 - DRAW)
+                    else:
+                        successors.append(table_index(0, strong_king, strong_piece, end))
+                elif move.promotion:
+                    target = promotions.get(move.promotion)
+                    value = target[table_index(1, strong_king, end, weak_king)] if target else DRAW
+                    successors.append(-1 - value)
+                else:
+                    successors.append(table_index(1, strong_king, end, weak_king))
+        board.set_piece(strong_king >> 3, strong_king & 7, "--")
+        board.set_piece(strong_piece >> 3, strong_piece & 7, "--")
+        board.set_piece(weak_king >> 3, weak_king & 7, "--")
+    offsets[TABLE_SIZE] = len(successors)
+
+    #Predecessors, the same edges the other way round
+    pred_offsets = array("i", [0]) * (TABLE_SIZE + 1)
+    for successor in successors:
+        if successor >= 0:
+            pred_offsets[successor + 1] += 1
+    for index in range(TABLE_SIZE):
+        pred_offsets[index + 1] += pred_offsets[index]
+    predecessors = array("i", [0]) * pred_offsets[TABLE_SIZE]
+    fill = array("i", pred_offsets)
+    for index in range(TABLE_SIZE):
+        for i in range(offsets[index], offsets[index + 1]):
+            successor = successors[i]
+            if successor >= 0:
+                predecessors[fill[successor]] = index
+                fill[successor] += 1
+
+    #buckets[ply]: (index, won) waiting to be settled at that distance
+    buckets = [[] for _ in range(2 * MAX_DTM + 2)]
+    #Successor moves not yet known to lose, and the longest known win among them
+    remaining = array("i", [0]) * TABLE_SIZE
+    longest_win = array("i", [0]) * TABLE_SIZE
+    #Set when some move is not a win for the opponent, the position can't be lost
+    escape = bytearray(TABLE_SIZE)
+    for index in range(TABLE_SIZE):
+        if not legal[index]:
+            continue
+        if mated[index]:
+            buckets[0].append((index, False))
+            continue
+        for i in range(offsets[index], offsets[index + 1]):
+            successor = successors[i]
+            if successor >= 0:
+                remaining[index] += 1
+                continue
+            result, dtm = decode_value(-1 - successor)
+            if result == 1:
+                longest_win[index] = max(longest_win[index], dtm)
+            else:
+                escape[index] = 1
+                if result == -1:
+                    buckets[dtm + 1].append((index, True))
+        if offsets[index + 1] == offsets[index]:
+            #Stalemate
+            escape[index] = 1
+        elif remaining[index] == 0 and not escape[index]:
+            buckets[longest_win[index] + 1].append((index, False))
+
+    values = bytearray(TABLE_SIZE)
+    settled = bytearray(TABLE_SIZE)
+    for ply, bucket in enumerate(buckets):
+        for index, won in bucket:
+            if settled[index]:
+                continue
+            if ply > MAX_DTM:
+                raise ValueError(f"{table_name(piece)} distance {ply} does not fit in a byte")
+            settled[index] = 1
+            values[index] = ply if won else LOSS_BASE + ply
+            for i in range(pred_offsets[index], pred_offsets[index + 1]):
+                previous = predecessors[i]
+                if settled[previous]:
+                    continue
+                if not won:
+                    buckets[ply + 1].append((previous, True))
+                    continue
+                remaining[previous] -= 1
+                longest_win[previous] = max(longest_win[previous], ply)
+                if remaining[previous] == 0 and not escape[previous]:
+                    buckets[longest_win[previous] + 1].append((previous, False))
+    return values
+
+def generate_all(directory, pieces=TABLE_PIECES, verbose=True):
+    os.makedirs(directory, exist_ok=True)
+    finished = {}
+    #Promotion targets first so the pawn table can look them up
+    for piece in sorted(pieces, key=lambda p: p == "P"):
+        start = time.perf_counter()
+        promotions = {p: finished[p] for p in PROMOTION_TABLES if p in finished}
+        if piece == "P":
+            for p in PROMOTION_TABLES:
+                if p not in promotions:
+                    path = os.path.join(directory, table_name(p) + ".tb")
+                    with open(path, "rb") as f:
+                        promotions[p] = f.read()
+        values = generate_table(piece, promotions)
+        finished[piece] = values
+        with open(os.path.join(directory, table_name(piece) + ".tb"), "wb") as f:
+            f.write(values)
+        if verbose:
+            wins = sum(1 for v in values if 0 < v < LOSS_BASE)
+            print(f"{table_name(piece)}: {wins} wins, longest mate {max(v for v in values if v < LOSS_BASE)} plies, "
+                  f"{time.perf_counter() - start:.1f}s")
+
+#Read-only access to generated tables in a directory, each one memory
+#mapped. Missing tables are simply not probed
+class Tablebase:
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.files = []
+        for piece in TABLE_PIECES:
+            path = os.path.join(directory, table_name(piece) + ".tb")
+            if os.path.exists(path) and os.path.getsize(path) == TABLE_SIZE:
+                f = open(path, "rb")
+                self.files.append(f)
+                self.tables[piece] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for f in self.files:
+            f.close()
+        self.tables = {}
+        self.files = []
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    #(result, dtm) for the side to move, None when the position is not covered
+    def probe(self, board):
+        if board.piece_count > TABLEBASE_PIECES or any(board.castle_rights.values()):
+            return None
+        strong = None
+        for piece, squares in board.piece_squares.items():
+            if squares and piece[1] != "K":
+                if strong is not None:
+                    return None
+                strong = piece
+        if strong is None or strong[1] in ("N", "B"):
+            #Bare kings, or a minor piece that can't mate
+            return 0, 0
+        table = self.tables.get(strong[1])
+        if table is None:
+            return None
+        #Mirror black-strong positions so the strong side is white
+        flip = strong[0] == "b"
+        weak = "w" if flip else "b"
+        def square(pos):
+            r, c = pos
+            return ((7 - r) if flip else r) * 8 + c
+        (piece_pos,) = board.piece_squares[strong]
+        strong_to_move = board.white_to_move != flip
+        index = table_index(0 if strong_to_move else 1, square(board.king_squares[strong[0]]),
+                            square(piece_pos), square(board.king_squares[weak]))
+        return decode_value(table[index])
+    #Search score for the side to move at ply, mates counted from the root
+    def probe_score(self, board, ply):
+        entry = self.probe(board)
+        if entry is None:
+            return None
+        result, dtm = entry
+        if result == 0:
+            return 0
+        if result == 1:
+            return MATE_SCORE - (ply + dtm)
+        return -MATE_SCORE + ply + dtm
+    #Fastest win, slowest loss, otherwise a move that holds the draw.
+    #None when some reply is outside the tables
+    def best_move(self, board, rules):
+        if self.probe(board) is None:
+            return None
+        color = "w" if board.white_to_move else "b"
+        best = None
+        best_rank = None
+        for move in rules.generate_legal_moves(color):
+            board.make_move(move)
+            entry = self.probe(board)
+            board.undo_move()
+            if entry is None:
+                return None
+            result, dtm = entry
+            #The opponent's result: their loss is our win
+            if result == -1:
+                rank = (2, -dtm)
+            elif result == 0:
+                rank = (1, 0)
+            else:
+                rank = (0, dtm)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate K+piece vs K endgame tablebases by retrograde analysis.")
+    parser.add_argument("directory", help="where the .tb files are written")
+    parser.add_argument("--tables", nargs="+", choices=TABLE_PIECES, default=list(TABLE_PIECES),
+                        help="pieces to generate tables for, KPK needs KQK and KRK")
+    args = parser.parse_args(argv)
+    generate_all(args.directory, args.tables)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import sys
+import threading
+from engine.bitboard import new_board
+from engine.rules import Rules
+from engine.eval import Evaluator
+from engine.search import Search, TranspositionTable, MATE_SCORE, MATE_THRESHOLD
+
+ENGINE_NAME = "Python Chess Engine"
+ENGINE_AUTHOR = "Python Chess Engine authors"
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+#go arguments passed straight on to Search.find_best_move
+GO_LIMITS = ("depth", "movetime", "wtime", "btime", "winc", "binc", "nodes")
+
+#UCI score field, mates are counted in full moves from the side to move
+def format_score(score) -> str:
+    if score is None:
+        return "cp 0"
+    if abs(score) >= MATE_THRESHOLD:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {int(score)}"
+
+#Reads commands on the calling thread while searches run on their own
+#thread, so stop, ponderhit and isready are answered mid-search
+class UCIEngine:
+    def __init__(self, backend="grid", output=None):
+        self.backend = backend
+        self.output = output if output else sys.stdout
+        self.output_lock = threading.Lock()
+        self.evaluator = Evaluator()
+        self.tt = TranspositionTable()
+        self.search_thread = None
+        #Set by stop or ponderhit, bestmove for go infinite/ponder waits on it
+        self.release = threading.Event()
+        self.set_position(START_FEN, [])
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def set_position(self, fen, moves):
+        board = new_board(fen, self.backend)
+        rules = Rules(board)
+        for text in moves:
+            move = rules.move_from_uci(text)
+            if move is None:
+                self.send(f"info string illegal move {text}")
+                break
+            board.make_move(move)
+        self.board = board
+        self.rules = rules
+        self.search = Search(board, rules, self.evaluator, self.tt)
+        self.search.verbose = False
+        self.search.on_iteration = self.send_info
+
+    #Returns False once the GUI has sent quit
+    def handle(self, line) -> bool:
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.tt.clear()
+            self.set_position(START_FEN, [])
+        elif command == "position":
+            self.stop_search()
+            self.handle_position(tokens[1:])
+        elif command == "go":
+            self.stop_search()
+            self.handle_go(tokens[1:])
+        elif command == "stop":
+            self.stop_search()
+        elif command == "ponderhit":
+            self.search.ponderhit()
+            self.release.set()
+        elif command == "quit":
+            self.stop_search()
+            return False
+        return True
+
+    def handle_position(self, tokens):
+        if not tokens:
+            return
+        moves = []
+        if "moves" in tokens:
+            index = tokens.index("moves")
+            moves = tokens[index + 1:]
+            tokens = tokens[:index]
+        if tokens[0] == "startpos":
+            fen = START_FEN
+        elif tokens[0] == "fen":
+            fen = " ".join(tokens[1:])
+        else:
+            self.send(f"info string unknown position type {tokens[0]}")
+            return
+        #Board takes an empty FEN as the start position, so catch it here
+        if not fen:
+            self.send("info string bad fen (empty)")
+            return
+        try:
+            self.set_position(fen, moves)
+        except (ValueError, IndexError, KeyError):
+            self.send(f"info string bad fen {fen}")
+
+    def handle_go(self, tokens):
+        limits = {}
+        ponder = False
+        infinite = False
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in GO_LIMITS:
+                try:
+                    limits[token] = int(tokens[i + 1])
+                except (ValueError, IndexError):
+                    self.send(f"info string bad value for {token}")
+                    return
+                i += 2
+                continue
+            if token == "ponder":
+                ponder = True
+            elif token == "infinite":
+                infinite = True
+            i += 1
+        self.release.clear()
+        self.search_thread = threading.Thread(
+            target=self.run_search, args=(limits, ponder, infinite), daemon=True)
+        self.search_thread.start()
+
+    def run_search(self, limits, ponder, infinite):
+        best_move = self.search.find_best_move(ponder=ponder, **limits)
+        #UCI: no bestmove for infinite or pondering searches until told to stop
+        if ponder or infinite:
+            self.release.wait()
+        if best_move is None:
+            self.send("bestmove 0000")
+            return
+        line = f"bestmove {best_move.to_uci()}"
+        if len(self.search.pv) > 1:
+            line += f" ponder {self.search.pv[1].to_uci()}"
+        self.send(line)
+
+    def stop_search(self):
+        if self.search_thread is None:
+            return
+        self.search.stop()
+        self.release.set()
+        self.search_thread.join()
+        self.search_thread = None
+
+    def send_info(self, search):
+        nodes = search.nodes_searched + search.qnodes
+        elapsed = max(1, int(search.elapsed_ms()))
+        nps = nodes * 1000 // elapsed
+        pv = " ".join(move.to_uci() for move in search.pv)
+        self.send(f"info depth {search.completed_depth} score {format_score(search.best_score)} "
+                  f"nodes {nodes} nps {nps} time {elapsed} pv {pv}")
+
+    def loop(self, stream=None):
+        stream = stream if stream else sys.stdin
+        for line in stream:
+            if not self.handle(line.strip()):
+                break
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the engine over the UCI protocol on stdin/stdout.")
+    parser.add_argument("--backend", choices=["grid", "bitboard"], default="grid")
+    args = parser.parse_args(argv)
+    UCIEngine(args.backend).loop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import queue
+import threading
+from engine.rules import Rules
+from engine.search import Search
+
+class SearchWorker:
+    #Runs Search.find_best_move in a background thread on a copy of the
+    #board, so the caller's board can be drawn and used meanwhile.
+    #The finished best move (or None) arrives on the results queue
+    def __init__(self, board, evaluator=None, tt=None, tablebase=None, **limits):
+        self.board = board.copy()
+        self.rules = Rules(self.board)
+        self.search = Search(self.board, self.rules, evaluator, tt, tablebase)
+        self.search.verbose = False
+        self.limits = limits
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.finished = False
+        self.cancelled = False
+        self.best_move = None
+        #Exception the search died with, raised again from poll() and wait()
+        self.error = None
+    def start(self):
+        self.thread.start()
+        return self
+    def _run(self):
+        #Always report back, otherwise poll() and wait() never finish
+        best_move = None
+        error = None
+        try:
+            best_move = self.search.find_best_move(**self.limits)
+        except Exception as e:
+            error = e
+        finally:
+            self.results.put((best_move, error))
+    def _finish(self, result):
+        self.best_move, self.error = result
+        self.finished = True
+        if self.error is not None:
+            raise self.error
+    #Non-blocking, True once the search has finished and best_move is set
+    def poll(self) -> bool:
+        if self.finished:
+            return True
+        try:
+            result = self.results.get_nowait()
+        except queue.Empty:
+            return False
+        self._finish(result)
+        return True
+    #Blocks until the search is done, returns its best move
+    def wait(self, timeout=None):
+        if self.finished:
+            return self.best_move
+        try:
+            result = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._finish(result)
+        return self.best_move
+    #Stops the search soon after, its result should then be ignored
+    def cancel(self):
+        self.cancelled = True
+        self.search.stop()
+    def is_running(self) -> bool:
+        return self.thread.is_alive()
+    #Live progress for display while the search runs
+    def get_depth(self) -> int:
+        return self.search.completed_depth
+    def get_nodes(self) -> int:
+        return self.search.nodes_searched + self.search.qnodes
@@ -0,0 +1,33 @@
+import random
+
+PIECES = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+CASTLE_RIGHTS = ["wK", "wQ", "bK", "bQ"]
+
+#Fixed seed so keys (and anything stored by key) are identical between runs
+_rng = random.Random(0x5A0B1157)
+
+#One 64-bit key per piece per square, indexed by row * 8 + col
+PIECE_KEYS = {piece: [_rng.getrandbits(64) for _ in range(64)] for piece in PIECES}
+SIDE_KEY = _rng.getrandbits(64)
+CASTLE_KEYS = {right: _rng.getrandbits(64) for right in CASTLE_RIGHTS}
+#En passant is keyed by file only, the rank follows from the side to move
+EN_PASSANT_KEYS = [_rng.getrandbits(64) for _ in range(8)]
+
+
+def compute_key(board) -> int:
+    #Full recompute, used when a position is set up from scratch
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board.get_piece(r, c)
+            if piece != "--":
+                key ^= PIECE_KEYS[piece][r * 8 + c]
+    #Side key is in when black is to move
+    if not board.white_to_move:
+        key ^= SIDE_KEY
+    for right in CASTLE_RIGHTS:
+        if board.castle_rights[right]:
+            key ^= CASTLE_KEYS[right]
+    if board.en_passant_square is not None:
+        key ^= EN_PASSANT_KEYS[board.en_passant_square[1]]
+    return key
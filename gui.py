@@ -35,10 +35,13 @@ class ChessGUI:
         self.check_color = (255, 0, 0, 100)
         
         # Game state
-        self.game = Game(player_color="w", ai_depth=4)
+        self.game = Game(player_color="w", ai_depth=4, ponder=True)
         self.selected_square = None
         self.legal_moves_for_selected = []
         
+        # Background AI search (SearchWorker), None when the AI is idle
+        self.ai_worker = None
+        
         # Font for text
         self.font = pygame.font.Font(None, 36)
         self.small_font = pygame.font.Font(None, 24)
@@ -157,7 +160,8 @@ class ChessGUI:
     def highlight_check(self):
         """Highlight the king if in check"""
         color = "w" if self.game.board.white_to_move else "b"
-        if self.game.rules.in_check(color):
+        # Cached per position by Game, so drawing every frame costs nothing
+        if self.game.is_in_check():
             king_pos = self.game.board.find_king(color)
             if king_pos:
                 row, col = king_pos
@@ -245,11 +249,43 @@ class ChessGUI:
             self.legal_moves_for_selected = []
     
     def handle_ai_move(self):
-        """Let the AI make its move"""
-        if self.game.is_ai_turn() and not self.game.game_over:
-            # Add a small delay so player can see the position
-            pygame.time.wait(500)
-            self.game.make_ai_move()
+        """
+        Start the AI search in a background worker on the AI's turn and
+        play its move once the worker reports it. Called every frame, so
+        the window keeps drawing and handling events while the AI thinks.
+        """
+        if self.ai_worker is None:
+            # Book and tablebase moves are played inside start_ai_search,
+            # only searches come back as a worker
+            self.ai_worker = self.game.start_ai_search()
+            return
+        
+        if self.ai_worker.poll():
+            worker = self.ai_worker
+            self.ai_worker = None
+            if not worker.cancelled:
+                # Passing the line lets the game ponder on the player's expected reply
+                self.game.apply_ai_move(worker.best_move, worker.search.pv)
+    
+    def cancel_ai_search(self):
+        """Stop a running AI search and drop its result"""
+        if self.ai_worker is not None:
+            self.ai_worker.cancel()
+            self.ai_worker = None
+    
+    def draw_thinking(self):
+        """Show a thinking indicator with the search's live depth and node count"""
+        if self.ai_worker is None:
+            return
+        text = self.small_font.render(
+            f"Thinking... depth {self.ai_worker.get_depth()}, {self.ai_worker.get_nodes()} nodes",
+            True, (255, 255, 255)
+        )
+        text_rect = text.get_rect()
+        text_rect.topleft = (30, 10)
+        bg_rect = text_rect.inflate(12, 8)
+        pygame.draw.rect(self.screen, (0, 0, 0), bg_rect)
+        self.screen.blit(text, text_rect)
     
     def run(self):
         """Main game loop"""
@@ -268,12 +304,14 @@ class ChessGUI:
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         # Reset game
+                        self.cancel_ai_search()
                         self.game.reset_game()
                         self.selected_square = None
                         self.legal_moves_for_selected = []
                     
                     elif event.key == pygame.K_u:
                         # Undo last move
+                        self.cancel_ai_search()
                         self.game.undo_last_move()
                         self.selected_square = None
                         self.legal_moves_for_selected = []
@@ -289,11 +327,13 @@ class ChessGUI:
             self.draw_pieces()
             self.draw_coordinates()
             self.draw_status()
+            self.draw_thinking()
             
             # Update display
             pygame.display.flip()
             self.clock.tick(self.fps)
         
+        self.cancel_ai_search()
         pygame.quit()
         sys.exit()
 